@@ -1,182 +1,1186 @@
 import os
+import io
+import json
+import heapq
+import logging
 import math
-from flask import Flask, request, jsonify
+from itertools import islice
+import click
+from flask import Blueprint, Flask, current_app, request, jsonify, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
-from flask_sqlalchemy import SQLAlchemy
 from dotenv import load_dotenv
+from sqlalchemy import inspect, text, union_all
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+from werkzeug.datastructures import MIMEAccept, MultiDict
+from werkzeug.http import parse_accept_header
+from compatibility import COMPATIBLE_DONORS, compatible_groups, match_rank
+from availability import AvailabilityCounts
+from bulk_import import COORDINATES_ERROR, FORMATS, BulkImporter, iter_records
+from catch_up import settled_max_id
+from db_instance import READ_BIND, db, read_only
+import instrumentation
+from distance_engine import calculate_distance, nearest_within, np, valid_coordinates
+from donor_snapshot import DonorLog, DonorSnapshot, write_snapshot
+from district_index import DistrictIndex
+from engine_config import engine_options, install_sqlite_pragmas, read_database_url
+from http_cache import (accepted_codings, compress, held_etag, representation_etag, strong_etag,
+                        validator_headers)
+from indian_districts import INDIAN_DISTRICTS
+from models import DataVersion, User, bump_data_version, normalize_district
+from pagination import decode_cursor, encode_cursor, parse_page_args
+from query_cache import QueryCache
+from serialization import RowSerializer, encode_page
+from spatial_index import DonorSpatialIndex, bounding_box
+from write_batcher import WriteBatcher
 
 # Load environment variables
 load_dotenv()
 
-# Create Flask app
-app = Flask(__name__)
-CORS(app, resources={r"/api/*": {"origins": "*"}}, supports_credentials=True)
-
 # Database configuration
 basedir = os.path.abspath(os.path.dirname(__file__))
 database_url = os.environ.get('DATABASE_URL', f'sqlite:///{os.path.join(basedir, "blood_donor.db")}')
-app.config['SQLALCHEMY_DATABASE_URI'] = database_url
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
-# Initialize DB
-db = SQLAlchemy(app)
-
-# Models
-class User(db.Model):
-    __tablename__ = 'users'
-    
-    id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(100), nullable=False)
-    email = db.Column(db.String(100), nullable=False, unique=True)
-    phone = db.Column(db.String(20), nullable=False)
-    blood_group = db.Column(db.String(10), nullable=False)
-    District = db.Column(db.String(100), nullable=False)
-    latitude = db.Column(db.Float, nullable=True)
-    longitude = db.Column(db.Float, nullable=True)
-    created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
-    updated_at = db.Column(db.DateTime, default=db.func.current_timestamp(), onupdate=db.func.current_timestamp())
-
-    def __init__(self, name, email, phone, blood_group, District, latitude=None, longitude=None):
-        self.name = name
-        self.email = email
-        self.phone = phone
-        self.blood_group = blood_group
-        self.District = District
-        self.latitude = latitude
-        self.longitude = longitude
-
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'name': self.name,
-            'email': self.email,
-            'phone': self.phone,
-            'blood_group': self.blood_group,
-            'District': self.District,
-            'latitude': self.latitude,
-            'longitude': self.longitude,
-            'created_at': self.created_at.isoformat() if self.created_at else None
-        }
-
-# Ensure tables are created
-with app.app_context():
+
+# Routes and CLI commands; registered on the app by create_app()
+api = Blueprint('api', __name__, cli_group=None)
+
+# Grid index over donor coordinates for /api/donors/nearby, filled lazily.
+# With SPATIAL_INDEX_ENABLED=0 nearby searches use a SQL bounding-box query instead.
+# If DONOR_SNAPSHOT_PATH names a snapshot written by `flask snapshot-donors`,
+# every worker maps that file and only indexes donors registered since, until
+# donors are deleted or moved after it was written.
+# PARALLEL_SEARCH_PROCESSES > 1 splits snapshot searches measuring at least
+# PARALLEL_SEARCH_MIN_DONORS donors across a pool of that many processes.
+DONOR_SNAPSHOT_PATH = os.environ.get('DONOR_SNAPSHOT_PATH')
+donor_snapshot = DonorSnapshot.open(DONOR_SNAPSHOT_PATH,
+                                    processes=int(os.environ.get('PARALLEL_SEARCH_PROCESSES', 0)),
+                                    parallel_min_donors=int(os.environ.get('PARALLEL_SEARCH_MIN_DONORS', 50000)))
+spatial_index = DonorSpatialIndex(cell_size=float(os.environ.get('SPATIAL_INDEX_CELL_DEG', 0.1)),
+                                  base=donor_snapshot)
+
+# Donor counts for /api/stats/availability; caught up by id like the spatial
+# index and rebuilt from GROUP BY queries once AVAILABILITY_MAX_AGE seconds old
+availability = AvailabilityCounts(cell_size=float(os.environ.get('AVAILABILITY_CELL_DEG', 0.5)))
+AVAILABILITY_MAX_AGE = float(os.environ.get('AVAILABILITY_MAX_AGE', 600))
+
+# Standard district spellings, applied to registrations and District searches
+district_index = DistrictIndex(INDIAN_DISTRICTS)
+
+def canonical_district(District):
+    """The standard spelling of District, or District itself when no district matches."""
+    if not isinstance(District, str):
+        return District
+    return district_index.canonicalize(District) or District.strip()
+
+def search_district(District):
+    # district_norm value a District search parameter should match
+    return normalize_district(canonical_district(District))
+
+# Search response cache; QUERY_CACHE_MAX_BYTES=0 disables it
+query_cache = QueryCache(
+    max_bytes=int(os.environ.get('QUERY_CACHE_MAX_BYTES', 32 * 1024 * 1024)),
+    ttl=float(os.environ.get('QUERY_CACHE_TTL', 30))
+)
+
+# Request timing, DB query counts and /api/metrics
+instrumentation.registry.gauge(
+    'query_cache_stat', 'Search response cache statistics.',
+    lambda: {(name,): value for name, value in query_cache.stats().items()}, ['stat'])
+instrumentation.registry.gauge(
+    'spatial_index_donors', 'Donors held in the nearby-search grid index.', lambda: spatial_index.size)
+instrumentation.registry.gauge(
+    'spatial_index_max_id', 'Highest donor id synced into the grid index.', lambda: spatial_index.max_id)
+instrumentation.registry.gauge(
+    'availability_max_id', 'Highest donor id counted in the availability stats.', lambda: availability.max_id)
+
+# Columns returned by the search endpoints, in User.to_dict() order
+DONOR_FIELDS = (
+    ('id', 'int'),
+    ('name', 'str'),
+    ('email', 'str'),
+    ('phone', 'str'),
+    ('blood_group', 'str'),
+    ('District', 'str'),
+    ('latitude', 'float'),
+    ('longitude', 'float'),
+    ('created_at', 'datetime'),
+)
+DONOR_COLUMNS = [getattr(User, name) for name, _ in DONOR_FIELDS]
+donor_serializer = RowSerializer(DONOR_FIELDS)
+nearby_serializer = RowSerializer(DONOR_FIELDS + (('distance', 'float'),))
+
+def upgrade_schema():
+    # create_all() never alters existing tables, so add columns/indexes introduced later
+    columns = {column['name'] for column in inspect(db.engine).get_columns('users')}
+    if 'district_norm' not in columns:
+        with db.engine.begin() as conn:
+            conn.execute(text('ALTER TABLE users ADD COLUMN district_norm VARCHAR(100)'))
+    if 'data_version' not in columns:
+        with db.engine.begin() as conn:
+            conn.execute(text('ALTER TABLE users ADD COLUMN data_version BIGINT'))
+    if 'rewrites' not in {column['name'] for column in inspect(db.engine).get_columns('data_version')}:
+        with db.engine.begin() as conn:
+            conn.execute(text('ALTER TABLE data_version ADD COLUMN rewrites BIGINT NOT NULL DEFAULT 0'))
+    if db.session.get(DataVersion, 1) is None:
+        db.session.add(DataVersion(id=1))
+        db.session.flush()
+    User.query.filter(User.district_norm.is_(None)).update(
+        {User.district_norm: db.func.lower(db.func.trim(User.District))},
+        synchronize_session=False
+    )
+    User.query.filter(User.updated_at.is_(None)).update(
+        {User.updated_at: db.func.coalesce(User.created_at, db.func.current_timestamp())},
+        synchronize_session=False
+    )
+    # Also stamps rows from before data_version existed, which
+    # /api/donors/changes would not see otherwise
+    bump_data_version(db.session)
+    db.session.commit()
+    for index in User.__table__.indexes:
+        index.create(db.engine, checkfirst=True)
+
+def init_db():
+    """Create missing tables and apply schema upgrades; safe to run repeatedly."""
     db.create_all()
+    upgrade_schema()
 
-    # Insert seed data if empty
-    if User.query.count() == 0:
-        seed_users = [
-            User("John Doe", "john@example.com", "123-456-7890", "A+", "New York", 40.7128, -74.0060),
-            User("Jane Smith", "jane@example.com", "987-654-3210", "O-", "Los Angeles", 34.0522, -118.2437),
-            User("Mike Johnson", "mike@example.com", "555-123-4567", "B+", "Chicago", 41.8781, -87.6298),
-            User("Sarah Wilson", "sarah@example.com", "555-987-6543", "AB+", "New York", 40.7308, -73.9975),
-            User("David Brown", "david@example.com", "555-789-0123", "A+", "Chicago", 41.8840, -87.6532),
-        ]
-        db.session.bulk_save_objects(seed_users)
-        db.session.commit()
-        print("Sample users added.")
+SAMPLE_USERS = [
+    ("John Doe", "john@example.com", "123-456-7890", "A+", "New York", 40.7128, -74.0060),
+    ("Jane Smith", "jane@example.com", "987-654-3210", "O-", "Los Angeles", 34.0522, -118.2437),
+    ("Mike Johnson", "mike@example.com", "555-123-4567", "B+", "Chicago", 41.8781, -87.6298),
+    ("Sarah Wilson", "sarah@example.com", "555-987-6543", "AB+", "New York", 40.7308, -73.9975),
+    ("David Brown", "david@example.com", "555-789-0123", "A+", "Chicago", 41.8840, -87.6532),
+]
+
+def seed_db():
+    """Insert the sample users into an empty users table; returns how many were added."""
+    if db.session.query(User.id).first() is not None:
+        return 0
+    db.session.bulk_save_objects([User(*user) for user in SAMPLE_USERS])
+    bump_data_version(db.session)
+    db.session.commit()
+    return len(SAMPLE_USERS)
+
+@api.cli.command('init-db')
+def init_db_command():
+    """Create the database tables and indexes."""
+    init_db()
+    click.echo("Database initialized.")
+
+@api.cli.command('seed')
+def seed_command():
+    """Add sample users if there are no users yet."""
+    added = seed_db()
+    click.echo("Sample users added." if added else "Users already present; nothing to seed.")
+
+@api.cli.command('canonicalize-districts')
+def canonicalize_districts_command():
+    """Rewrite stored District values to their canonical spelling."""
+    changed = 0
+    for (District,) in db.session.query(User.District).distinct().all():
+        canonical = canonical_district(District)
+        if canonical != District:
+            changed += User.query.filter(User.District == District).update(
+                {User.District: canonical, User.district_norm: normalize_district(canonical)},
+                synchronize_session=False
+            )
+    bump_data_version(db.session)
+    db.session.commit()
+    click.echo(f"Updated {changed} donors.")
 
 # Routes
 
-@app.route('/api/register', methods=['POST'])
-def register_user():
-    data = request.get_json()
-    print(f"[REGISTER] Received: {data}")
-    
-    required = ['name', 'email', 'phone', 'bloodGroup', 'District', 'latitude', 'longitude']
-    for field in required:
+REGISTRATION_FIELDS = ['name', 'email', 'phone', 'bloodGroup', 'District', 'latitude', 'longitude']
+
+def validate_registration(data):
+    """Return an error message for an invalid donor payload, or None.
+
+    District is replaced in place with its canonical spelling, or with
+    "Unknown" when empty.
+    """
+    for field in REGISTRATION_FIELDS:
         if field in ['latitude', 'longitude']:
             if field not in data or data.get(field) is None:
-                return jsonify({'error': f"Location coordinates are required. Please use the 'Get My Location' button."}), 400
+                return "Location coordinates are required. Please use the 'Get My Location' button."
         elif field == 'District':
             # District is sent from frontend but might be empty if detection failed
             if field not in data:
-                return jsonify({'error': f"Missing required field: {field}"}), 400
+                return f"Missing required field: {field}"
             # If District is empty, we'll use a default value
             if not data.get(field):
                 data['District'] = "Unknown"
         elif not data.get(field):
-            return jsonify({'error': f"Missing required field: {field}"}), 400
+            return f"Missing required field: {field}"
+    # The spatial index and snapshot store groups as small integer codes
+    if not isinstance(data['bloodGroup'], str) or data['bloodGroup'] not in COMPATIBLE_DONORS:
+        return f"bloodGroup must be one of: {', '.join(COMPATIBLE_DONORS)}"
+    try:
+        coordinates = float(data['latitude']), float(data['longitude'])
+    except (TypeError, ValueError):
+        return COORDINATES_ERROR
+    if not valid_coordinates(*coordinates):
+        return COORDINATES_ERROR
+    # Spellings differing only in case or punctuation are stored under one name
+    data['District'] = canonical_district(data['District'])
+    # PostgreSQL rejects longer values with an error (SQLite stores them)
+    for field, column in [('name', User.name), ('email', User.email), ('phone', User.phone),
+                          ('District', User.District)]:
+        if len(str(data[field])) > column.type.length:
+            return f"{field} must be at most {column.type.length} characters"
+    return None
 
-    if User.query.filter_by(email=data['email']).first():
-        return jsonify({'error': "Email already registered"}), 409
+def donors_changed():
+    # New rows must be visible to cached and indexed searches right away
+    query_cache.bump_version()
+    if spatial_index.loaded:
+        sync_spatial_index()
+    if availability.loaded:
+        availability.add_rows(db.session.execute(availability_catch_up_statement()))
 
-    user = User(
-        name=data['name'],
-        email=data['email'],
-        phone=data['phone'],
-        blood_group=data['bloodGroup'],
-        District=data['District'],
-        latitude=data.get('latitude'),
-        longitude=data.get('longitude')
-    )
+def donors_committed():
+    """donors_changed() after a write has committed.
 
+    The donors are saved by then, so a failure here is logged rather than
+    reported to the client, whose retry would only find them registered.
+    Searches catch up on their own next sync.
+    """
     try:
-        db.session.add(user)
+        donors_changed()
+    except Exception:
+        db.session.rollback()
+        current_app.logger.exception("Updating searches after a donor write failed")
+
+# Dialects whose INSERT supports ON CONFLICT DO NOTHING ... RETURNING
+UPSERT_INSERTS = {'sqlite': sqlite_insert, 'postgresql': postgresql_insert}
+
+def registration_row(data):
+    return {
+        'name': data['name'],
+        'email': data['email'],
+        'phone': data['phone'],
+        'blood_group': data['bloodGroup'],
+        'District': data['District'],
+        'district_norm': normalize_district(data['District']),
+        'latitude': data.get('latitude'),
+        'longitude': data.get('longitude'),
+    }
+
+def registration_statement(rows):
+    """One INSERT for rows that returns the new Users.
+
+    On SQLite and PostgreSQL rows whose email is already registered are
+    skipped by ON CONFLICT DO NOTHING and simply not returned, so checking
+    for the email and inserting is a single atomic statement. Elsewhere a
+    taken email raises IntegrityError.
+    """
+    upsert = UPSERT_INSERTS.get(db.session.get_bind().dialect.name)
+    if upsert is None:
+        return db.insert(User).values(rows).returning(User)
+    return upsert(User).values(rows).on_conflict_do_nothing(index_elements=[User.email]).returning(User)
+
+def insert_registrations(rows):
+    """Insert rows in one statement and transaction.
+
+    Returns each row's User.to_dict(), or None when its email was already
+    registered (or repeated earlier in rows).
+    """
+    try:
+        users = db.session.scalars(registration_statement(rows)).all()
+        bump_data_version(db.session)
+        registered = {user.email: user.to_dict() for user in users}
         db.session.commit()
-        return jsonify({'message': "User registered", 'user': user.to_dict()}), 201
-    except Exception as e:
+    except Exception:
         db.session.rollback()
-        print(f"[ERROR] Registration failed: {e}")
+        raise
+    if registered:
+        donors_committed()
+    return [registered.pop(row['email'], None) for row in rows]
+
+# REGISTRATION_BATCHING=1 commits concurrent registrations together: one
+# INSERT and commit per batch, one batch at a time, each waiting up to
+# REGISTRATION_BATCH_MS for more to arrive (SQLite and PostgreSQL only)
+registration_batcher = WriteBatcher(
+    insert_registrations,
+    max_wait=float(os.environ.get('REGISTRATION_BATCH_MS', 0)) / 1000,
+    max_size=int(os.environ.get('REGISTRATION_BATCH_SIZE', 100))
+) if os.environ.get('REGISTRATION_BATCHING', '0') == '1' else None
+
+def register(row):
+    if registration_batcher is not None and db.session.get_bind().dialect.name in UPSERT_INSERTS:
+        return registration_batcher.submit(row)
+    return insert_registrations([row])[0]
+
+@api.route('/api/register', methods=['POST'])
+def register_user():
+    data = request.get_json()
+
+    error = validate_registration(data)
+    if error:
+        return jsonify({'error': error}), 400
+
+    try:
+        donor = register(registration_row(data))
+    except IntegrityError:
+        donor = None
+    except Exception as e:
+        current_app.logger.exception("Registration failed")
         return jsonify({'error': str(e)}), 500
+    if donor is None:
+        return jsonify({'error': "Email already registered"}), 409
+    current_app.logger.info("Registered donor %s", donor['id'])
+    return jsonify({'message': "User registered", 'user': donor}), 201
 
-@app.route('/api/donors', methods=['GET'])
-def get_donors():
-    blood_group = request.args.get('bloodGroup')
-    District = request.args.get('District')
+BULK_CONTENT_TYPES = {'text/csv': 'csv', 'application/x-ndjson': 'ndjson'}
 
-    query = User.query
-    if blood_group:
-        query = query.filter(User.blood_group == blood_group)
+@api.route('/api/donors/bulk', methods=['POST'])
+def bulk_import_donors():
+    fmt = request.args.get('format') or BULK_CONTENT_TYPES.get(request.mimetype)
+    if fmt not in FORMATS:
+        return jsonify({'error': "Send text/csv or application/x-ndjson, or pass ?format=csv|ndjson"}), 415
+    chunk_size = request.args.get('chunkSize', type=int, default=1000)
+    if not 1 <= chunk_size <= 10000:
+        return jsonify({'error': "chunkSize must be between 1 and 10000"}), 400
+
+    # Read the body as it arrives instead of buffering the whole roster
+    stream = io.TextIOWrapper(request.stream, encoding='utf-8', newline='')
+    report = import_donors(stream, fmt, chunk_size)
+    status = 201 if report['inserted'] else 400
+    return jsonify(report), status
+
+def import_donors(stream, fmt, chunk_size=1000):
+    importer = BulkImporter(db.session, User, validate_registration, normalize_district, chunk_size,
+                            before_commit=bump_data_version)
+    try:
+        return importer.import_records(iter_records(stream, fmt))
+    finally:
+        if importer.report['inserted']:
+            donors_committed()
+
+@api.cli.command('import-donors')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(FORMATS), help="Defaults to the file extension.")
+@click.option('--chunk-size', default=1000, show_default=True)
+def import_donors_command(path, fmt, chunk_size):
+    """Import donors from a CSV or NDJSON file."""
+    fmt = fmt or ('csv' if path.lower().endswith('.csv') else 'ndjson')
+    with open(path, encoding='utf-8', newline='') as stream:
+        report = import_donors(stream, fmt, chunk_size)
+    click.echo(json.dumps(report, indent=2))
+
+# Search endpoints. The argument parsing, statements and response encoding
+# below are shared with the async handlers in asgi.py.
+
+def donor_search_args(args):
+    """Parse /api/donors query args into (blood_group, District, compatible, page).
+
+    Raises ValueError with the message for a 400 response.
+    """
+    blood_group = args.get('bloodGroup')
+    District = args.get('District')
+    compatible = args.get('compatible') == '1'
+    if compatible and compatible_groups(blood_group) is None:
+        raise ValueError("compatible=1 requires a valid bloodGroup")
+    # Compatible searches list exact matches first, so they page on (rank, id)
+    page = parse_page_args(args, sorts={'match': 2} if compatible else {'id': 1})
+    return blood_group, District, compatible, page
+
+def donor_search_key(blood_group, District, compatible, page):
+    return ('donors', blood_group or None, search_district(District) or None, compatible,
+            page and page.cache_key)
+
+def donor_search_query(blood_group, District, compatible, after=None):
+    """Core SELECT of plain donor rows plus the ORDER BY that pages it."""
+    stmt = db.select(*DONOR_COLUMNS)
+    order = [User.id]
+    if compatible:
+        # One IN query over every compatible group instead of a search per group
+        rank = db.case((User.blood_group == blood_group, 0), else_=1)
+        stmt = stmt.where(User.blood_group.in_(compatible_groups(blood_group)))
+        order = [rank, User.id]
+    elif blood_group:
+        stmt = stmt.where(User.blood_group == blood_group)
     if District:
-        query = query.filter(User.District.ilike(District))  # Case-insensitive match
+        stmt = stmt.where(User.district_norm == search_district(District))  # Case-insensitive match
+    if after is not None:
+        if compatible:
+            after_rank, after_id = after
+            stmt = stmt.where(db.or_(rank > after_rank, db.and_(rank == after_rank, User.id > after_id)))
+        else:
+            stmt = stmt.where(User.id > after)
+    return stmt, order
 
-    donors = query.all()
-    return jsonify([user.to_dict() for user in donors]), 200
+def donor_search_statement(blood_group, District, compatible, page):
+    stmt, order = donor_search_query(blood_group, District, compatible, page and page.after)
+    if page is not None:
+        return stmt.order_by(*order).limit(page.fetch)
+    if compatible:
+        return stmt.order_by(*order)
+    return stmt
 
-@app.route('/api/donors/nearby', methods=['GET'])
-def get_nearby_donors():
-    blood_group = request.args.get('bloodGroup')
-    latitude = request.args.get('latitude', type=float)
-    longitude = request.args.get('longitude', type=float)
-    radius = request.args.get('radius', type=float, default=10)
+def donor_search_page(rows, blood_group, compatible, page):
+    """Trim fetched rows to the requested page; returns (rows, next_cursor)."""
+    if page is None:
+        return rows, None
+    if compatible:
+        return page.slice(rows, key=lambda row: (match_rank(blood_group, row.blood_group), row.id))
+    return page.slice(rows, key=lambda row: row.id)
+
+@api.route('/api/donors', methods=['GET'])
+@read_only
+def get_donors():
+    try:
+        blood_group, District, compatible, page = donor_search_args(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    if wants_ndjson():
+        if page is not None:
+            return jsonify({'error': "Streaming exports cannot be combined with limit, cursor, offset or sort"}), 400
+        stmt, order = donor_search_query(blood_group, District, compatible)
+        rows = stream_ndjson(stmt.order_by(*order), donor_serializer)
+        return current_app.response_class(stream_with_context(rows), mimetype='application/x-ndjson'), 200
+
+    key, etag = search_validators(donor_search_key(blood_group, District, compatible, page),
+                                  current_data_version())
+    headers = search_not_modified(request.headers, etag)
+    if headers is not None:
+        return current_app.response_class(status=304, headers=headers)
+    version = query_cache.version
+    cached = query_cache.get(key)
+    if cached is not None:
+        return search_response(key, version, cached, etag)
+
+    # Plain row tuples; no User instances are built for search results
+    rows = db.session.execute(donor_search_statement(blood_group, District, compatible, page)).all()
+    rows, next_cursor = donor_search_page(rows, blood_group, compatible, page)
+    body = cache_search(key, version, donor_serializer, rows, page, next_cursor)
+    return search_response(key, version, body, etag)
+
+STREAM_CHUNK_ROWS = int(os.environ.get('STREAM_CHUNK_ROWS', 1000))
+
+def ndjson_requested(stream, accept):
+    """Whether a search asked for NDJSON, by stream=1 or an Accept header preferring it."""
+    if stream == '1':
+        return True
+    best = parse_accept_header(accept, MIMEAccept).best_match(['application/json', 'application/x-ndjson'])
+    return best == 'application/x-ndjson'
+
+def wants_ndjson():
+    return ndjson_requested(request.args.get('stream'), request.headers.get('Accept'))
+
+def stream_ndjson(stmt, serializer):
+    # yield_per fetches STREAM_CHUNK_ROWS rows at a time (a server-side cursor on
+    # Postgres), so memory stays flat and each batch is flushed as it arrives
+    result = db.session.execute(stmt.execution_options(yield_per=STREAM_CHUNK_ROWS))
+    for rows in result.partitions():
+        yield ''.join([serializer.encode_row(row) + '\n' for row in rows])
+
+def nearby_search_args(args):
+    """Parse /api/donors/nearby query args.
+
+    Returns (blood_group, latitude, longitude, radius, compatible, page);
+    raises ValueError with the message for a 400 response.
+    """
+    blood_group = args.get('bloodGroup')
+    latitude = args.get('latitude', type=float)
+    longitude = args.get('longitude', type=float)
+    radius = args.get('radius', type=float, default=10)
+
+    compatible = args.get('compatible') == '1'
 
     if latitude is None or longitude is None:
-        return jsonify({'error': 'Latitude and longitude are required'}), 400
+        raise ValueError('Latitude and longitude are required')
+    if not valid_coordinates(latitude, longitude):
+        raise ValueError(COORDINATES_ERROR)
+    if not math.isfinite(radius):
+        raise ValueError('radius must be a finite number')
+    if compatible and compatible_groups(blood_group) is None:
+        raise ValueError("compatible=1 requires a valid bloodGroup")
+    # Compatible searches list exact matches first, then by distance: (rank, distance, id)
+    sorts = {'match': 3} if compatible else {'distance': 2, 'id': 1}
+    page = parse_page_args(args, sorts=sorts)
+    return blood_group, latitude, longitude, radius, compatible, page
+
+def nearby_search_key(blood_group, latitude, longitude, radius, compatible, page):
+    return ('nearby', blood_group or None, latitude, longitude, radius, compatible, page and page.cache_key)
+
+@api.route('/api/donors/nearby', methods=['GET'])
+@read_only
+def get_nearby_donors():
+    try:
+        search = nearby_search_args(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    page = search[-1]
+
+    key, etag = search_validators(nearby_search_key(*search), current_data_version())
+    headers = search_not_modified(request.headers, etag)
+    if headers is not None:
+        return current_app.response_class(status=304, headers=headers)
+    version = query_cache.version
+    cached = query_cache.get(key)
+    if cached is not None:
+        return search_response(key, version, cached, etag)
+
+    if current_app.config['SPATIAL_INDEX_ENABLED']:
+        sync_spatial_index()
+    matches, next_cursor = nearby_matches(*search)
+    nearby = with_distances(load_rows([donor_id for donor_id, _ in matches]), matches)
+    body = cache_search(key, version, nearby_serializer, nearby, page, next_cursor)
+    return search_response(key, version, body, etag)
+
+def nearby_matches(blood_group, latitude, longitude, radius, compatible, page, candidates=None):
+    """(donor_id, distance) pairs for one nearby search, plus the next cursor.
+
+    With the spatial index enabled this is pure in-memory work; callers sync
+    the index first. Without it, candidates may hold the search's rows from
+    batch_candidates() instead of querying for them.
+    """
+    next_cursor = None
+    if compatible:
+        ranked = find_compatible_nearby(latitude, longitude, radius, blood_group,
+                                        limit=page and page.fetch, after=page and page.after,
+                                        candidates=candidates)
+        if page is not None:
+            ranked, next_cursor = page.slice(ranked, key=lambda match: match)
+        matches = [(donor_id, dist) for _, dist, donor_id in ranked]
+    elif page is None:
+        matches = find_nearby(latitude, longitude, radius, blood_group, candidates=candidates)
+    elif page.sort == 'distance':
+        matches = find_nearby(latitude, longitude, radius, blood_group, limit=page.fetch, after=page.after,
+                              candidates=candidates)
+        matches, next_cursor = page.slice(matches, key=lambda match: (match[1], match[0]))
+    else:
+        matches = find_nearby(latitude, longitude, radius, blood_group, candidates=candidates)
+        if page.after is not None:
+            matches = [match for match in matches if match[0] > page.after]
+        matches = heapq.nsmallest(page.fetch, matches)
+        matches, next_cursor = page.slice(matches, key=lambda match: match[0])
+    return matches, next_cursor
+
+def with_distances(rows, matches):
+    """Donor rows in match order, each extended with its rounded distance.
+
+    rows may also be a dict of rows by id, to share one lookup between searches.
+    Matches without a row (deleted since they were indexed, or not yet on a
+    lagging read replica) are left out. The page's cursor comes from the
+    matches, so the next page still starts after them.
+    """
+    if not isinstance(rows, dict):
+        rows = {row.id: row for row in rows}
+    return [tuple(rows[donor_id]) + (round(dist, 2),) for donor_id, dist in matches if donor_id in rows]
+
+MAX_BATCH_QUERIES = 100
+
+def batch_query_params(query):
+    # JSON values as the strings nearby_search_args() expects from a query string
+    return MultiDict({
+        name: ('1' if value else '0') if isinstance(value, bool) else str(value)
+        for name, value in query.items() if value is not None
+    })
+
+def nearby_batch_args(data):
+    """Parse a /api/donors/nearby/batch body into a list of nearby_search_args() tuples.
+
+    Raises ValueError with the message for a 400 response.
+    """
+    queries = data.get('queries') if isinstance(data, dict) else None
+    if not isinstance(queries, list) or not queries:
+        raise ValueError('Send {"queries": [...]} with at least one query')
+    if len(queries) > MAX_BATCH_QUERIES:
+        raise ValueError(f"At most {MAX_BATCH_QUERIES} queries per batch")
+    searches = []
+    for position, query in enumerate(queries):
+        if not isinstance(query, dict):
+            raise ValueError(f"queries[{position}] must be an object")
+        try:
+            searches.append(nearby_search_args(batch_query_params(query)))
+        except ValueError as e:
+            raise ValueError(f"queries[{position}]: {e}") from None
+    return searches
 
-    query = User.query
+@api.route('/api/donors/nearby/batch', methods=['POST'])
+@read_only
+def nearby_batch():
+    """Several nearby searches in one request, answered like separate GETs.
+
+    The spatial index is synced once, every query is matched against it in
+    memory, and the donors found by all of them are loaded together. Each
+    result is cached under the same key as the equivalent GET.
+    """
+    try:
+        searches = nearby_batch_args(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    version = query_cache.version
+    data_version = current_data_version()
+    keys = [versioned_key(nearby_search_key(*search), data_version) for search in searches]
+    bodies = [query_cache.get(key) for key in keys]
+    # Repeated queries (several hospitals sharing a search) are matched once
+    pending = {key: search for key, search, body in zip(keys, searches, bodies) if body is None}
+    if pending:
+        if current_app.config['SPATIAL_INDEX_ENABLED']:
+            sync_spatial_index()
+            found = {key: nearby_matches(*search) for key, search in pending.items()}
+        else:
+            candidates = batch_candidates(list(pending.values()))
+            found = {key: nearby_matches(*search, candidates=rows)
+                     for (key, search), rows in zip(pending.items(), candidates)}
+        ids = sorted({donor_id for matches, _ in found.values() for donor_id, _ in matches})
+        rows = {row.id: row for row in load_rows(ids)}
+        fresh = {key: cache_search(key, version, nearby_serializer, with_distances(rows, matches),
+                                   pending[key][-1], next_cursor)
+                 for key, (matches, next_cursor) in found.items()}
+        bodies = [body if body is not None else fresh[key] for key, body in zip(keys, bodies)]
+
+    # Each body is already the encoded JSON of one search
+    body = b'{"results":[' + b','.join(body.rstrip(b'\n') for body in bodies) + b']}\n'
+    return cached_response(body)
+
+def lean_json_enabled():
+    # RowSerializer only reproduces jsonify's compact, sorted, ASCII-escaped output
+    provider = current_app.json
+    if not isinstance(provider, DefaultJSONProvider):
+        return False
+    compact = provider.compact if provider.compact is not None else not current_app.debug
+    return compact and provider.sort_keys and provider.ensure_ascii
+
+def encode_search(serializer, rows, page=None, next_cursor=None):
+    """Response body bytes for a search result, as jsonify would produce them."""
+    if lean_json_enabled():
+        body = serializer.encode_rows(rows)
+        if page is not None:
+            body = encode_page(body, next_cursor)
+        return (body + '\n').encode()
+    payload = [serializer.to_dict(row) for row in rows]
+    if page is not None:
+        payload = {'donors': payload, 'next_cursor': next_cursor}
+    return current_app.json.response(payload).get_data()
+
+def cache_search(key, version, serializer, rows, page=None, next_cursor=None):
+    body = encode_search(serializer, rows, page, next_cursor)
+    query_cache.set(key, body, version)
+    return body
+
+def cached_response(body):
+    return current_app.response_class(body, status=200, mimetype='application/json')
+
+def data_version_statement():
+    """The donors' data version; every registration, import or edit bumps it (see DataVersion)."""
+    return db.select(DataVersion.version).where(DataVersion.id == 1)
+
+def current_data_version():
+    """The donors' data version, or None with HTTP_CACHE_ENABLED off."""
+    if not current_app.config['HTTP_CACHE_ENABLED']:
+        return None
+    return db.session.execute(data_version_statement()).scalar()
+
+def versioned_key(key, data_version):
+    # Cached bodies are then never older than the ETag they are sent with,
+    # including after writes made by other workers
+    return key if data_version is None else key + (data_version,)
+
+def search_validators(key, data_version):
+    """(cache key, ETag) for a search; the ETag is None without a data_version.
+
+    There is no Last-Modified: with one-second resolution it could not tell
+    apart two writes in the same second, and the ETag already covers it.
+    """
+    if data_version is None:
+        return key, None
+    key = versioned_key(key, data_version)
+    # Lean and jsonify bodies differ byte for byte, so the encoder is part of the tag
+    return key, strong_etag(key, lean_json_enabled())
+
+def response_codings(headers):
+    if not current_app.config['COMPRESSION_ENABLED']:
+        return []
+    return accepted_codings(headers.get('accept-encoding'))
+
+def search_not_modified(headers, etag):
+    """Headers for a 304 when the client's copy of a search is current, else None.
+
+    headers are the request headers, looked up by lower-case name.
+    """
+    if etag is None:
+        return None
+    vary = [('Vary', 'Accept-Encoding')] if current_app.config['COMPRESSION_ENABLED'] else []
+    if_none_match = headers.get('if-none-match')
+    if not if_none_match:
+        return None
+    # Whichever representation the client has, it was built from this data
+    held = held_etag(if_none_match, [representation_etag(etag, coding)
+                                     for coding in [None] + response_codings(headers)])
+    return None if held is None else validator_headers(held) + vary
+
+def search_representation(headers, key, version, body, etag=None):
+    """(body, response headers) for a search body, compressed when large and accepted.
+
+    Compressed bodies are cached beside the plain one, so repeating a search
+    does not compress it again.
+    """
+    coding = None
+    response_headers = [('Content-Type', 'application/json')]
+    if current_app.config['COMPRESSION_ENABLED']:
+        response_headers.append(('Vary', 'Accept-Encoding'))
+        codings = response_codings(headers)
+        if codings and len(body) >= current_app.config['COMPRESSION_MIN_BYTES']:
+            coding = codings[0]
+            compressed = query_cache.get(key + (coding,))
+            if compressed is None:
+                compressed = compress(body, coding)
+                query_cache.set(key + (coding,), compressed, version)
+            body = compressed
+            response_headers.append(('Content-Encoding', coding))
+    if etag is not None:
+        response_headers += validator_headers(representation_etag(etag, coding))
+    return body, response_headers
+
+def search_response(key, version, body, etag=None):
+    body, headers = search_representation(request.headers, key, version, body, etag)
+    return current_app.response_class(body, status=200, headers=headers)
+
+def find_nearby(latitude, longitude, radius, blood_group=None, limit=None, after=None, candidates=None):
+    """Return (donor_id, distance) pairs within radius km, nearest first.
+
+    limit selects only the nearest matches; after is a (distance, id) cursor.
+    candidates are prefetched (id, latitude, longitude, blood_group) rows.
+    """
+    stats = {}
+    if current_app.config['SPATIAL_INDEX_ENABLED']:
+        matches = spatial_index.search(latitude, longitude, radius, blood_group, limit, after, stats)
+    else:
+        if candidates is None:
+            rows = bounding_box_candidates(latitude, longitude, radius, blood_group)
+        else:
+            rows = [row[:3] for row in candidates]
+        stats['scanned'] = len(rows)
+        matches = nearest_within(latitude, longitude, radius, rows, limit, after)
+    instrumentation.record_nearby(stats['scanned'], len(matches))
+    return matches
+
+def find_compatible_nearby(latitude, longitude, radius, recipient, limit=None, after=None, candidates=None):
+    """Nearby donors of every group compatible with recipient.
+
+    Returns (rank, distance, donor_id) tuples, exact blood-group matches
+    (rank 0) first, then by distance. Each group is searched in its own
+    partition and the sorted lists are merged; after is a
+    (rank, distance, id) cursor.
+    """
+    groups = compatible_groups(recipient)
+    use_index = current_app.config['SPATIAL_INDEX_ENABLED']
+    if not use_index:
+        if candidates is None:
+            candidates = bounding_box_query(
+                latitude, longitude, radius, User.blood_group).filter(User.blood_group.in_(groups))
+        rows_by_group = {}
+        for donor_id, lat, lon, group in candidates:
+            rows_by_group.setdefault(group, []).append((donor_id, lat, lon))
+
+    scanned = 0
+    per_group = []
+    for group in groups:
+        rank = match_rank(recipient, group)
+        group_after = None
+        if after is not None:
+            if rank < after[0]:
+                continue
+            if rank == after[0]:
+                group_after = after[1:]
+        if use_index:
+            stats = {}
+            matches = spatial_index.search(latitude, longitude, radius, group, limit, group_after, stats)
+            scanned += stats['scanned']
+        else:
+            rows = rows_by_group.get(group, [])
+            matches = nearest_within(latitude, longitude, radius, rows, limit, group_after)
+            scanned += len(rows)
+        per_group.append([(rank, dist, donor_id) for donor_id, dist in matches])
+
+    ranked = list(islice(heapq.merge(*per_group), limit))
+    instrumentation.record_nearby(scanned, len(ranked))
+    return ranked
+
+def bounding_box_filter(latitude, longitude, radius):
+    # Served by ix_users_blood_group_lat_lon (or ix_users_lat_lon without a blood group)
+    min_lat, max_lat, lon_ranges = bounding_box(latitude, longitude, radius)
+    return db.and_(
+        User.latitude.between(min_lat, max_lat),
+        db.or_(*[User.longitude.between(min_lon, max_lon) for min_lon, max_lon in lon_ranges])
+    )
+
+def bounding_box_query(latitude, longitude, radius, *columns):
+    return db.session.query(User.id, User.latitude, User.longitude, *columns).filter(
+        bounding_box_filter(latitude, longitude, radius))
+
+def bounding_box_candidates(latitude, longitude, radius, blood_group=None):
+    query = bounding_box_query(latitude, longitude, radius)
     if blood_group:
         query = query.filter(User.blood_group == blood_group)
+    return query.all()
+
+def batch_candidates_statement(searches):
+    """The bounding-box queries of several nearby searches as one UNION ALL.
+
+    Rows are (position of the search, id, latitude, longitude, blood_group);
+    each branch still uses the same index as a single search.
+    """
+    selects = []
+    for position, (blood_group, latitude, longitude, radius, compatible, _) in enumerate(searches):
+        select = db.select(db.literal(position).label('search'), User.id, User.latitude,
+                           User.longitude, User.blood_group).where(
+            bounding_box_filter(latitude, longitude, radius))
+        if compatible:
+            select = select.where(User.blood_group.in_(compatible_groups(blood_group)))
+        elif blood_group:
+            select = select.where(User.blood_group == blood_group)
+        selects.append(select)
+    return union_all(*selects)
+
+def batch_candidates(searches):
+    """Candidate (id, latitude, longitude, blood_group) rows for each search, in one round trip."""
+    candidates = [[] for _ in searches]
+    for position, donor_id, lat, lon, group in db.session.execute(batch_candidates_statement(searches)):
+        candidates[position].append((donor_id, lat, lon, group))
+    return candidates
+
+def spatial_index_sync_statement(index):
+    # Rows inserted since the last sync, including other workers' inserts and
+    # rows that committed after a higher id (rows without coordinates are
+    # fetched too, so they are not taken for a gap)
+    return db.select(User.id, User.blood_group, User.latitude, User.longitude).where(
+        index.catch_up.where(User.id)
+    ).order_by(User.id)
+
+# Syncs that both the Flask and the async handlers run are written once, as
+# generators that yield each statement and receive its rows; run_steps()
+# executes them on the session, asgi.run_steps() on an async connection
+
+def next_step(steps, rows=None):
+    """The next statement of steps after sending it rows, or None when it is done."""
+    try:
+        return steps.send(rows)
+    except StopIteration:
+        return None
+
+def run_steps(steps):
+    stmt = next_step(steps)
+    while stmt is not None:
+        stmt = next_step(steps, db.session.execute(stmt).all())
+
+def first_value(rows):
+    return rows[0][0] if rows else None
+
+def rewrites_statement():
+    return db.select(DataVersion.rewrites).where(DataVersion.id == 1)
+
+def current_snapshot(rewrites):
+    """donor_snapshot, or None once donors were deleted or moved after it was written."""
+    if donor_snapshot is None or donor_snapshot.rewrites == rewrites:
+        return donor_snapshot
+    return None
+
+def current_spatial_index(rewrites):
+    """The index to sync and search, given DataVersion.rewrites.
+
+    The index only ever adds ids, so after donors were deleted or moved it
+    would keep serving the old rows, and ids reused after a delete would
+    never be indexed. It is then replaced by an empty one, which the sync
+    fills from scratch. The same holds for the snapshot and its log, so the
+    new index has no base until the snapshot is rewritten and the worker
+    restarted. Syncs stay on the index they started with, so rows fetched
+    for the old one never mark ids as seen in the new one.
+    """
+    global spatial_index
+    index = spatial_index
+    snapshot = current_snapshot(rewrites)
+    if index.rewrites is None and index.base is snapshot:
+        index.rewrites = rewrites
+    elif rewrites != index.rewrites:
+        if snapshot is None and donor_snapshot is not None:
+            logging.getLogger(__name__).warning(
+                "Donors were deleted or moved since %s was written; indexing them from the database "
+                "until it is rewritten with `flask snapshot-donors`", donor_snapshot.path)
+        index = spatial_index = DonorSpatialIndex(index.cell_size, base=snapshot, rewrites=rewrites)
+    return index
 
-    nearby = []
-    for user in query.all():
-        if user.latitude is not None and user.longitude is not None:
-            dist = calculate_distance(latitude, longitude, user.latitude, user.longitude)
-            if dist <= radius:
-                data = user.to_dict()
-                data['distance'] = round(dist, 2)
-                nearby.append(data)
-
-    return jsonify(nearby), 200
-
-def calculate_distance(lat1, lon1, lat2, lon2):
-    R = 6371  # Earth radius in km
-    dLat = math.radians(lat2 - lat1)
-    dLon = math.radians(lon2 - lon1)
-    a = (math.sin(dLat/2)**2 +
-         math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) *
-         math.sin(dLon/2)**2)
-    return R * (2 * math.atan2(math.sqrt(a), math.sqrt(1-a)))
-
-@app.route('/api/health', methods=['GET'])
+def prime_spatial_index(index):
+    # Rows other workers logged since the snapshot, so a new worker's first sync has little to fetch
+    if index.base is not None and not index.loaded:
+        index.load(index.base.log.rows(index.max_id))
+
+def index_rows(index, rows):
+    """Add rows from spatial_index_sync_statement() to the index and its snapshot's log."""
+    if index.base is not None:
+        index.base.log.append(rows)
+    index.load(rows)
+
+def spatial_index_sync_steps():
+    """Bring the spatial index up to date; a generator of steps for run_steps()."""
+    index = current_spatial_index(first_value((yield rewrites_statement())))
+    prime_spatial_index(index)
+    index_rows(index, (yield spatial_index_sync_statement(index)))
+
+def sync_spatial_index():
+    run_steps(spatial_index_sync_steps())
+
+@api.cli.command('snapshot-donors')
+@click.option('--path', help="Defaults to DONOR_SNAPSHOT_PATH.")
+def snapshot_donors_command(path):
+    """Write the donor snapshot that workers map for nearby search."""
+    path = path or DONOR_SNAPSHOT_PATH
+    if not path:
+        raise click.UsageError("Set DONOR_SNAPSHOT_PATH or pass --path")
+    if np is None:
+        raise click.UsageError("Donor snapshots need numpy")
+    # Read first: a delete or move committing while the rows are read must leave the snapshot stale
+    rewrites = db.session.execute(rewrites_statement()).scalar()
+    # Workers read the newest ids from the log or the database, where late commits are caught
+    max_id = settled_max_id(db.session.execute(db.select(db.func.max(User.id))).scalar() or 0)
+    rows = db.session.execute(
+        db.select(User.id, User.blood_group, User.latitude, User.longitude).where(User.id <= max_id)
+    ).all()
+    previous = DonorSnapshot.open(path)
+    count = write_snapshot(path, rows, max_id, spatial_index.cell_size, rewrites)
+    log = DonorLog(path + '.log')
+    if previous is not None and previous.rewrites == rewrites:
+        log.compact(max_id)
+    else:
+        # Its rows may have been deleted or moved since they were logged
+        log.clear()
+    click.echo(f"Wrote {count} donors up to id {max_id} to {path}.")
+
+ROW_CHUNK_SIZE = 500
+
+def donor_rows_statements(ids, chunk_size=ROW_CHUNK_SIZE):
+    for start in range(0, len(ids), chunk_size):
+        yield db.select(*DONOR_COLUMNS).where(User.id.in_(ids[start:start + chunk_size]))
+
+def load_rows(ids):
+    rows = []
+    for stmt in donor_rows_statements(ids):
+        rows.extend(db.session.execute(stmt).all())
+    return rows
+
+CHANGES_LIMIT = 500
+MAX_CHANGES_LIMIT = 5000
+
+def changes_args(args):
+    """(after, limit) for /api/donors/changes; after is the (data_version, id) from the since token."""
+    limit = args.get('limit', type=int, default=CHANGES_LIMIT)
+    if not 1 <= limit <= MAX_CHANGES_LIMIT:
+        raise ValueError(f"limit must be between 1 and {MAX_CHANGES_LIMIT}")
+    token = args.get('since')
+    if not token:
+        return None, limit
+    try:
+        kind, after = decode_cursor(token)
+    except ValueError:
+        raise ValueError('Invalid sync token')
+    if (kind != 'changes' or not isinstance(after, list) or len(after) != 2
+            or not all(isinstance(part, int) for part in after)):
+        raise ValueError('Invalid sync token')
+    return tuple(after), limit
+
+def changes_statement(after, limit):
+    """Donor rows written after the (data_version, id) key, oldest first, plus their key.
+
+    Served by ix_users_data_version_id. Data versions become visible in
+    commit order (see DataVersion), so a row committed after a token was
+    issued always sorts after it; no write is skipped however slowly it commits.
+    """
+    stmt = db.select(*DONOR_COLUMNS, User.data_version).where(User.data_version.isnot(None))
+    if after is not None:
+        stmt = stmt.where(db.tuple_(User.data_version, User.id) > db.tuple_(
+            db.literal(after[0]), db.literal(after[1])))
+    return stmt.order_by(User.data_version, User.id).limit(limit + 1)
+
+def sync_token(data_version, donor_id):
+    return encode_cursor('changes', [data_version, donor_id])
+
+@api.route('/api/donors/changes', methods=['GET'])
+@read_only
+def donor_changes():
+    """Donors registered or updated since the since token, for incremental sync.
+
+    Without since, every donor is returned (in limit-sized batches). Keep
+    calling with next_token while has_more is true, then poll with the last
+    next_token.
+    """
+    try:
+        after, limit = changes_args(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    rows = db.session.execute(changes_statement(after, limit)).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if rows:
+        next_token = sync_token(rows[-1][-1], rows[-1].id)
+    else:
+        next_token = request.args.get('since') or None
+    donors = [donor_serializer.to_dict(row) for row in rows]
+    return jsonify({'donors': donors, 'next_token': next_token, 'has_more': has_more}), 200
+
+SUGGEST_LIMIT = 10
+MAX_SUGGEST_LIMIT = 50
+
+def district_suggest_args(args):
+    """(query, limit) for /api/districts/suggest; raises ValueError for a 400."""
+    limit = args.get('limit', type=int, default=SUGGEST_LIMIT)
+    if not 1 <= limit <= MAX_SUGGEST_LIMIT:
+        raise ValueError(f"limit must be between 1 and {MAX_SUGGEST_LIMIT}")
+    return args.get('q', ''), limit
+
+@api.route('/api/districts/suggest', methods=['GET'])
+def suggest_districts():
+    try:
+        query, limit = district_suggest_args(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(district_index.suggest(query, limit)), 200
+
+AVAILABILITY_BREAKDOWNS = ('district', 'cell')
+
+def availability_args(args):
+    """(district_norm, blood_group, by) for /api/stats/availability; raises ValueError for a 400."""
+    by = args.get('by', 'district')
+    if by not in AVAILABILITY_BREAKDOWNS:
+        raise ValueError(f"by must be one of: {', '.join(AVAILABILITY_BREAKDOWNS)}")
+    District = args.get('District')
+    if District and by == 'cell':
+        raise ValueError("District cannot be combined with by=cell")
+    return (search_district(District) if District else None), args.get('bloodGroup') or None, by
+
+def availability_stale():
+    return not availability.loaded or 0 < AVAILABILITY_MAX_AGE < availability.age()
+
+def availability_max_id_statement():
+    return db.select(db.func.max(User.id))
+
+def availability_rebuild_max_id(max_id):
+    # Aggregates stop short of the newest ids, which add_rows() counts one by
+    # one so that inserts committing out of id order are not missed
+    return settled_max_id(max_id or 0)
+
+def availability_rebuild_statements(max_id):
+    """GROUP BY queries for AvailabilityCounts.rebuild(), covering ids up to max_id."""
+    by_district = db.select(
+        User.district_norm, db.func.max(User.District), User.blood_group, db.func.count()
+    ).where(User.id <= max_id).group_by(User.district_norm, User.blood_group)
+    row, col = availability.cell_columns(User.latitude, User.longitude)
+    by_cell = db.select(row, col, User.blood_group, db.func.count()).where(
+        User.id <= max_id,
+        # Also drops NULL, NaN and infinite coordinates, as add_rows() does
+        User.latitude.between(-90, 90),
+        User.longitude.between(-180, 180)
+    ).group_by(row, col, User.blood_group)
+    return by_district, by_cell
+
+def availability_catch_up_statement():
+    return db.select(User.id, User.district_norm, User.District, User.blood_group,
+                     User.latitude, User.longitude).where(availability.catch_up.where(User.id)).order_by(User.id)
+
+def availability_sync_steps(rebuild=False):
+    """Catch the availability counts up, rebuilding them first if stale (or if rebuild is set).
+
+    A generator of steps for run_steps(). The database does the counting;
+    only the newest rows are fetched.
+    """
+    if rebuild or availability_stale():
+        max_id = availability_rebuild_max_id(first_value((yield availability_max_id_statement())))
+        by_district, by_cell = availability_rebuild_statements(max_id)
+        availability.rebuild(max_id, (yield by_district), (yield by_cell))
+    availability.add_rows((yield availability_catch_up_statement()))
+
+def rebuild_availability():
+    run_steps(availability_sync_steps(rebuild=True))
+
+def sync_availability():
+    run_steps(availability_sync_steps())
+
+@api.route('/api/stats/availability', methods=['GET'])
+@read_only
+def availability_stats():
+    try:
+        district_norm, blood_group, by = availability_args(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    sync_availability()
+    return jsonify(availability.summary(district_norm, blood_group, by)), 200
+
+@api.route('/api/stats/availability/rebuild', methods=['POST'])
+def rebuild_availability_stats():
+    rebuild_availability()
+    return jsonify(availability.stats()), 200
+
+@api.cli.command('availability')
+@click.option('--by', type=click.Choice(AVAILABILITY_BREAKDOWNS), default='district', show_default=True)
+def availability_command(by):
+    """Print donor counts per district (or grid cell) and blood group."""
+    rebuild_availability()
+    click.echo(json.dumps(availability.summary(by=by), indent=2, sort_keys=True))
+
+@api.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify(query_cache.stats()), 200
+
+@api.route('/api/metrics', methods=['GET'])
+def metrics():
+    return current_app.response_class(instrumentation.registry.render(), mimetype='text/plain; version=0.0.4')
+
+@api.route('/api/health', methods=['GET'])
 def health_check():
     return jsonify({'status': 'ok'}), 200
 
-@app.route('/', methods=['GET'])
+@api.route('/', methods=['GET'])
 def root():
     return jsonify({'message': 'Blood Donor API Root'}), 200
 
+def create_app(config=None):
+    """Build the Flask app. Does no database I/O; run `flask --app app init-db` first.
+
+    config overrides the settings read from the environment. The spatial
+    index and search cache are module-level, so they are shared by every app
+    created in one process.
+    """
+    app = Flask(__name__)
+    CORS(app, resources={r"/api/*": {"origins": "*"}}, supports_credentials=True)
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SPATIAL_INDEX_ENABLED'] = os.environ.get('SPATIAL_INDEX_ENABLED', '1') == '1'
+    # ETags and 304s for the search endpoints, from the donors' data version
+    app.config['HTTP_CACHE_ENABLED'] = os.environ.get('HTTP_CACHE_ENABLED', '1') == '1'
+    app.config['COMPRESSION_ENABLED'] = os.environ.get('COMPRESSION_ENABLED', '1') == '1'
+    app.config['COMPRESSION_MIN_BYTES'] = int(os.environ.get('COMPRESSION_MIN_BYTES', 1024))
+    if config:
+        app.config.update(config)
+    uri = app.config['SQLALCHEMY_DATABASE_URI']
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(uri))
+    read_url = read_database_url(uri)
+    if read_url:
+        # Search endpoints (@read_only) use this pool and leave the main one to writes
+        app.config.setdefault('SQLALCHEMY_BINDS', {READ_BIND: {'url': read_url, **engine_options(read_url)}})
+    db.init_app(app)
+    with app.app_context():
+        for key, engine in db.engines.items():
+            install_sqlite_pragmas(engine, read_only=key == READ_BIND)
+    instrumentation.install(app)
+    app.register_blueprint(api)
+    return app
+
+app = create_app()
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5001))
     debug = os.environ.get('FLASK_ENV', 'development') == 'development'
+    # The dev server is a single process, so it can set up the database itself
+    with app.app_context():
+        init_db()
+        if seed_db():
+            print("Sample users added.")
     print(f"Server running on http://localhost:{port}")
     app.run(debug=debug, host='0.0.0.0', port=port)
@@ -0,0 +1,255 @@
+"""ASGI entry point for the API.
+
+GET /api/donors, /api/donors/nearby, /api/districts/suggest,
+/api/stats/availability and /api/health are served by native async handlers that query through an async SQLAlchemy
+engine, so a slow query only holds up its own request. Everything else (registration, bulk
+import, NDJSON exports, profiled requests, the SQL bounding-box nearby path)
+runs the Flask app from app.py on a thread pool of ASGI_WSGI_THREADS threads.
+Both paths share the search cache, spatial index and metrics.
+
+    gunicorn asgi:app -c gunicorn.conf.py
+"""
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl
+
+from asgiref.sync import SyncToAsync, sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+from sqlalchemy.ext.asyncio import create_async_engine
+from werkzeug.datastructures import MultiDict
+
+import instrumentation
+from app import app as wsgi_app
+from app import (availability, availability_args, availability_sync_steps, data_version_statement,
+                 database_url, district_index, district_suggest_args, donor_rows_statements,
+                 donor_search_args, donor_search_key, donor_search_page, donor_search_statement,
+                 donor_serializer, cache_search, nearby_matches, nearby_search_args, nearby_search_key,
+                 nearby_serializer, ndjson_requested, next_step, query_cache, search_not_modified,
+                 search_representation, search_validators, spatial_index_sync_steps, with_distances)
+from engine_config import async_database_url, engine_options, install_sqlite_pragmas, read_database_url
+
+WSGI_THREADS = int(os.environ.get('ASGI_WSGI_THREADS', 8))
+
+
+# asgiref runs WSGI apps on one shared thread, which would serialize every
+# request handed to Flask, and WsgiToAsgi takes no executor. Up to at least
+# asgiref 3.8, run_wsgi_app is a @sync_to_async-wrapped method, so its plain
+# function can be re-wrapped with our own pool. That is an asgiref internal:
+# if it is not there, fall back to the stock (serialized) adapter.
+_run_wsgi_app = WsgiToAsgiInstance.__dict__.get('run_wsgi_app')
+
+if isinstance(_run_wsgi_app, SyncToAsync) and callable(getattr(_run_wsgi_app, 'func', None)):
+    class _ThreadedWsgiInstance(WsgiToAsgiInstance):
+        executor = ThreadPoolExecutor(max_workers=WSGI_THREADS, thread_name_prefix='wsgi')
+        run_wsgi_app = sync_to_async(_run_wsgi_app.func, thread_sensitive=False, executor=executor)
+
+    class _ThreadedWsgiToAsgi(WsgiToAsgi):
+        async def __call__(self, scope, receive, send):
+            await _ThreadedWsgiInstance(self.wsgi_application)(scope, receive, send)
+
+    flask_app = _ThreadedWsgiToAsgi(wsgi_app)
+else:
+    logging.getLogger(__name__).warning(
+        "This asgiref version runs Flask requests on one thread; ASGI_WSGI_THREADS is ignored")
+    flask_app = WsgiToAsgi(wsgi_app)
+engine = None
+
+
+def get_engine():
+    # Only the read-only handlers below use it, so it connects to the read database
+    global engine
+    if engine is None:
+        url = read_database_url(database_url) or database_url
+        engine = create_async_engine(async_database_url(url), **engine_options(url, async_engine=True))
+        install_sqlite_pragmas(engine.sync_engine, read_only=True)
+    return engine
+
+
+def error_body(message):
+    return wsgi_app.json.response({'error': message}).get_data()
+
+
+class Request:
+    def __init__(self, scope):
+        self.scope = scope
+        self.method = scope['method']
+        self.path = scope['path']
+        self.args = MultiDict(parse_qsl(scope['query_string'].decode('latin-1'), keep_blank_values=True))
+        self.headers = {name.decode('latin-1').lower(): value.decode('latin-1')
+                        for name, value in scope['headers']}
+
+    def wants_ndjson(self):
+        return ndjson_requested(self.args.get('stream'), self.headers.get('accept'))
+
+
+async def run_steps(conn, steps):
+    """app.run_steps() on an async connection.
+
+    The work between statements runs in a thread: index and count updates
+    take a while on large batches, and appending to a snapshot's log waits
+    for a file lock other workers may hold.
+    """
+    stmt = await asyncio.to_thread(next_step, steps)
+    while stmt is not None:
+        rows = (await conn.execute(stmt)).all()
+        stmt = await asyncio.to_thread(next_step, steps, rows)
+
+
+async def validate_search(req, key):
+    """search_validators() for key, plus the headers of a 304 if the client's copy is current."""
+    data_version = None
+    if wsgi_app.config['HTTP_CACHE_ENABLED']:
+        async with get_engine().connect() as conn:
+            data_version = (await conn.execute(data_version_statement())).scalar()
+    key, etag = search_validators(key, data_version)
+    return key, etag, search_not_modified(req.headers, etag)
+
+
+async def get_donors(req):
+    """Returns (status, body, headers), or None to hand the request to Flask."""
+    if req.wants_ndjson():
+        return None
+    try:
+        blood_group, District, compatible, page = donor_search_args(req.args)
+    except ValueError as e:
+        return 400, error_body(str(e))
+
+    key, etag, not_modified = await validate_search(
+        req, donor_search_key(blood_group, District, compatible, page))
+    if not_modified is not None:
+        return 304, b'', not_modified
+    version = query_cache.version
+    body = query_cache.get(key)
+    if body is None:
+        async with get_engine().connect() as conn:
+            result = await conn.execute(donor_search_statement(blood_group, District, compatible, page))
+            rows = result.all()
+        rows, next_cursor = donor_search_page(rows, blood_group, compatible, page)
+        body = cache_search(key, version, donor_serializer, rows, page, next_cursor)
+    return (200,) + search_representation(req.headers, key, version, body, etag)
+
+
+async def get_nearby_donors(req):
+    if not wsgi_app.config['SPATIAL_INDEX_ENABLED']:
+        return None
+    try:
+        search = nearby_search_args(req.args)
+    except ValueError as e:
+        return 400, error_body(str(e))
+    page = search[-1]
+
+    key, etag, not_modified = await validate_search(req, nearby_search_key(*search))
+    if not_modified is not None:
+        return 304, b'', not_modified
+    version = query_cache.version
+    body = query_cache.get(key)
+    if body is None:
+        async with get_engine().connect() as conn:
+            await run_steps(conn, spatial_index_sync_steps())
+            # A large search, or one waiting on the snapshot's process pool, would stall
+            # every request on this event loop; to_thread keeps the app context
+            matches, next_cursor = await asyncio.to_thread(nearby_matches, *search)
+            rows = []
+            for stmt in donor_rows_statements([donor_id for donor_id, _ in matches]):
+                rows.extend((await conn.execute(stmt)).all())
+        nearby = with_distances(rows, matches)
+        body = cache_search(key, version, nearby_serializer, nearby, page, next_cursor)
+    return (200,) + search_representation(req.headers, key, version, body, etag)
+
+
+async def suggest_districts(req):
+    # In-memory lookup, no I/O
+    try:
+        query, limit = district_suggest_args(req.args)
+    except ValueError as e:
+        return 400, error_body(str(e))
+    return 200, wsgi_app.json.response(district_index.suggest(query, limit)).get_data()
+
+
+async def availability_stats(req):
+    try:
+        district_norm, blood_group, by = availability_args(req.args)
+    except ValueError as e:
+        return 400, error_body(str(e))
+
+    async with get_engine().connect() as conn:
+        await run_steps(conn, availability_sync_steps())
+    return 200, wsgi_app.json.response(availability.summary(district_norm, blood_group, by)).get_data()
+
+
+async def health_check(req):
+    return 200, wsgi_app.json.response({'status': 'ok'}).get_data()
+
+
+ROUTES = {
+    '/api/donors': get_donors,
+    '/api/donors/nearby': get_nearby_donors,
+    '/api/districts/suggest': suggest_districts,
+    '/api/stats/availability': availability_stats,
+    '/api/health': health_check,
+}
+
+
+def response_headers(req, status, body, extra=None):
+    if extra is None:
+        extra = [('Content-Type', 'application/json')]
+    headers = [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in extra]
+    if status != 304:
+        headers.append((b'content-length', str(len(body)).encode()))
+    origin = req.headers.get('origin')
+    if origin and req.path.startswith('/api/'):
+        # What flask-cors sends for CORS(origins='*', supports_credentials=True)
+        headers += [(b'access-control-allow-origin', origin.encode('latin-1')),
+                    (b'access-control-allow-credentials', b'true'),
+                    (b'vary', b'Origin')]
+    return headers
+
+
+async def http(scope, receive, send):
+    handler = ROUTES.get(scope['path'])
+    if handler is None or scope['method'] != 'GET':
+        return await flask_app(scope, receive, send)
+    req = Request(scope)
+    if instrumentation.PROFILING_ENABLED and req.headers.get(instrumentation.PROFILE_HEADER.lower()) == '1':
+        return await flask_app(scope, receive, send)
+
+    started = time.perf_counter()
+    tally = instrumentation.track_db()
+    with wsgi_app.app_context():
+        response = await handler(req)
+    if response is None:
+        return await flask_app(scope, receive, send)
+    status, body, *extra = response
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': response_headers(req, status, body, *extra)})
+    await send({'type': 'http.response.body', 'body': body})
+    instrumentation.record_request(scope['path'], 'GET', status, time.perf_counter() - started, *tally)
+
+
+async def lifespan(scope, receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            get_engine()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            if engine is not None:
+                await engine.dispose()
+            _ThreadedWsgiInstance.executor.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'http':
+        await http(scope, receive, send)
+    elif scope['type'] == 'lifespan':
+        await lifespan(scope, receive, send)
+    else:
+        raise ValueError(f"Unsupported ASGI scope: {scope['type']}")
+
+
+app = application
@@ -0,0 +1,145 @@
+import threading
+import time
+from collections import Counter
+
+from sqlalchemy import Integer
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+
+from catch_up import CatchUp
+from distance_engine import valid_coordinates
+
+
+class grid_floor(FunctionElement):
+    """FLOOR() of a non-negative grid coordinate, portable to SQLite builds without math functions."""
+    type = Integer()
+    inherit_cache = True
+    name = 'grid_floor'
+
+
+@compiles(grid_floor)
+def _compile_grid_floor(element, compiler, **kw):
+    return 'FLOOR(%s)' % compiler.process(element.clauses, **kw)
+
+
+@compiles(grid_floor, 'sqlite')
+def _compile_grid_floor_sqlite(element, compiler, **kw):
+    # CAST truncates, which is the same as FLOOR for non-negative values
+    return 'CAST(%s AS INTEGER)' % compiler.process(element.clauses, **kw)
+
+
+class AvailabilityCounts:
+    """Donor counts by district and blood group, and by grid cell and blood group.
+
+    rebuild() replaces everything from aggregate query rows; add_rows()
+    counts donors inserted since, skipping ids already counted (catch_up)
+    so rows seen by both paths are only counted once. Reads never touch the users
+    table, and a single district or blood group is one dict lookup. Cells
+    are cell_size degrees, numbered from the south-west corner of the map so
+    SQL can compute them with an integer cast.
+    """
+
+    def __init__(self, cell_size=0.5):
+        self.cell_size = cell_size
+        self.catch_up = CatchUp()
+        self.loaded = False
+        self.built_at = None
+        self._totals = Counter()  # blood_group -> donors
+        self._districts = {}  # district_norm -> Counter(blood_group -> donors)
+        self._cells = {}  # (row, col) -> Counter(blood_group -> donors)
+        self._names = {}  # district_norm -> District as displayed
+        self._lock = threading.Lock()
+
+    @property
+    def max_id(self):
+        return self.catch_up.max_id
+
+    def cell(self, latitude, longitude):
+        return int((latitude + 90) / self.cell_size), int((longitude + 180) / self.cell_size)
+
+    def cell_columns(self, latitude, longitude):
+        """SQL expressions computing cell() from latitude and longitude columns."""
+        return (grid_floor((latitude + 90) / self.cell_size),
+                grid_floor((longitude + 180) / self.cell_size))
+
+    def rebuild(self, max_id, district_rows, cell_rows):
+        """Replace all counts with aggregate rows covering ids up to max_id.
+
+        district_rows are (district_norm, District, blood_group, count) and
+        cell_rows are (row, col, blood_group, count).
+        """
+        totals, districts, cells, names = Counter(), {}, {}, {}
+        for district_norm, District, blood_group, count in district_rows:
+            districts.setdefault(district_norm, Counter())[blood_group] += count
+            totals[blood_group] += count
+            names.setdefault(district_norm, District)
+        for row, col, blood_group, count in cell_rows:
+            cells.setdefault((int(row), int(col)), Counter())[blood_group] += count
+        with self._lock:
+            self._totals, self._districts, self._cells, self._names = totals, districts, cells, names
+            self.catch_up = CatchUp(max_id)
+            self.loaded = True
+            self.built_at = time.monotonic()
+
+    def add_rows(self, rows):
+        """Count (id, district_norm, District, blood_group, latitude, longitude) rows."""
+        with self._lock:
+            for donor_id, district_norm, District, blood_group, latitude, longitude in rows:
+                if not self.catch_up.see(donor_id):
+                    continue
+                self._totals[blood_group] += 1
+                self._districts.setdefault(district_norm, Counter())[blood_group] += 1
+                self._names.setdefault(district_norm, District)
+                if valid_coordinates(latitude, longitude):
+                    self._cells.setdefault(self.cell(latitude, longitude), Counter())[blood_group] += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'max_id': self.max_id,
+                'donors': sum(self._totals.values()),
+                'districts': len(self._districts),
+                'cells': len(self._cells),
+            }
+
+    def age(self):
+        """Seconds since the last rebuild, or None before the first."""
+        return None if self.built_at is None else time.monotonic() - self.built_at
+
+    def summary(self, district_norm=None, blood_group=None, by='district'):
+        """Counts as a JSON-ready dict, optionally for one district and/or blood group.
+
+        by='district' breaks the counts down per district and by='cell' per
+        grid cell, keyed by the cell's south-west corner.
+        """
+        def pick(counts):
+            if blood_group is None:
+                return dict(counts)
+            return {blood_group: counts[blood_group]} if counts.get(blood_group) else {}
+
+        with self._lock:
+            if district_norm is not None:
+                counts = self._districts.get(district_norm, Counter())
+                totals = pick(counts)
+                districts = {self._names[district_norm]: totals} if totals else {}
+            else:
+                totals = pick(self._totals)
+                districts = None if by == 'cell' else {
+                    self._names[norm]: picked for norm, counts in self._districts.items()
+                    for picked in [pick(counts)] if picked}
+            cells = None if by != 'cell' else [
+                (key, picked) for key, counts in self._cells.items()
+                for picked in [pick(counts)] if picked]
+            max_id = self.max_id
+
+        summary = {'total': sum(totals.values()), 'blood_groups': totals, 'max_id': max_id}
+        if cells is None:
+            summary['districts'] = districts
+        else:
+            summary['cell_size'] = self.cell_size
+            summary['cells'] = [
+                {'latitude': round(row * self.cell_size - 90, 6),
+                 'longitude': round(col * self.cell_size - 180, 6),
+                 'blood_groups': counts}
+                for (row, col), counts in sorted(cells)]
+        return summary
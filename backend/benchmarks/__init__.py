@@ -0,0 +1,4 @@
+"""Performance benchmarks for the Blood Donor API.
+
+Run from the backend directory, e.g. ``python -m benchmarks.serialization``.
+"""
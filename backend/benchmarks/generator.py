@@ -0,0 +1,72 @@
+"""Synthetic donor generator.
+
+Donors are clustered around the city/district centroids used by the frontend's
+sample donors and the seed data, with a realistic blood-group mix.
+
+    python -m benchmarks.generator 100000 > donors.ndjson
+"""
+import argparse
+import json
+import random
+import sys
+
+# Approximate share of each blood group among Indian donors
+BLOOD_GROUP_WEIGHTS = {
+    'O+': 0.357, 'B+': 0.321, 'A+': 0.229, 'AB+': 0.077,
+    'O-': 0.006, 'B-': 0.006, 'A-': 0.003, 'AB-': 0.001,
+}
+
+# District centroids from frontend/src/components/Search.js and seed_new.py
+DISTRICT_CENTROIDS = {
+    'Mumbai': (19.0760, 72.8777),
+    'Delhi': (28.7041, 77.1025),
+    'Bengaluru Urban': (12.9716, 77.5946),
+    'Hyderabad': (17.3850, 78.4867),
+    'Chennai': (13.0827, 80.2707),
+    'Kolkata': (22.5726, 88.3639),
+    'Pune': (18.5204, 73.8567),
+    'Ahmedabad': (23.0225, 72.5714),
+    'Jaipur': (26.9124, 75.7873),
+    'Lucknow': (26.8467, 80.9462),
+    'Coimbatore': (11.0168, 76.9558),
+    'Nagpur': (21.1458, 79.0882),
+    'Indore': (22.7196, 75.8577),
+    'Bhopal': (23.2599, 77.4126),
+    'Patna': (25.5941, 85.1376),
+}
+
+# Standard deviation of the donor scatter around a centroid, in degrees (~15 km)
+SPREAD_DEG = 0.15
+
+
+def generate_donors(count, seed=0, start=0):
+    """Yield count donor dicts using the /api/register field names."""
+    rng = random.Random(seed)
+    groups = list(BLOOD_GROUP_WEIGHTS)
+    weights = list(BLOOD_GROUP_WEIGHTS.values())
+    districts = list(DISTRICT_CENTROIDS)
+    for i in range(start, start + count):
+        District = rng.choice(districts)
+        lat, lon = DISTRICT_CENTROIDS[District]
+        yield {
+            'name': f'Donor {i}',
+            'email': f'donor{i}@bench.example.com',
+            'phone': f'9{i:09d}'[-10:],
+            'bloodGroup': rng.choices(groups, weights)[0],
+            'District': District,
+            'latitude': round(rng.gauss(lat, SPREAD_DEG), 6),
+            'longitude': round(rng.gauss(lon, SPREAD_DEG), 6),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write synthetic donors as NDJSON.')
+    parser.add_argument('count', type=int)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    for donor in generate_donors(args.count, args.seed):
+        sys.stdout.write(json.dumps(donor) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""Nearby search latency on a donor snapshot, inline versus 2..N pool processes.
+
+    python -m benchmarks.parallel --donors 1000000 --radius 200 --processes 1 2 4
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.generator import DISTRICT_CENTROIDS, generate_donors
+from donor_snapshot import DonorSnapshot, write_snapshot
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--donors', type=int, default=1000000)
+    parser.add_argument('--radius', type=float, default=200.0)
+    parser.add_argument('--limit', type=int, default=50,
+                        help="Nearest donors kept per search; 0 keeps every match.")
+    parser.add_argument('--blood-group')
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--processes', type=int, nargs='+', default=[1, 2, 4],
+                        help="Pool sizes to compare; 1 searches inline.")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    centroids = list(DISTRICT_CENTROIDS.values())
+    queries = []
+    for _ in range(args.queries):
+        lat, lon = rng.choice(centroids)
+        queries.append((lat + rng.uniform(-0.5, 0.5), lon + rng.uniform(-0.5, 0.5)))
+    limit = args.limit or None
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'donors.snapshot')
+        rows = ((i + 1, donor['bloodGroup'], donor['latitude'], donor['longitude'])
+                for i, donor in enumerate(generate_donors(args.donors, args.seed)))
+        write_snapshot(path, rows, args.donors)
+
+        report = {'donors': args.donors, 'radius': args.radius, 'limit': limit,
+                  'blood_group': args.blood_group, 'queries': args.queries,
+                  'cpus': os.cpu_count(), 'runs': []}
+        baseline = None
+        for processes in args.processes:
+            snapshot = DonorSnapshot(path, processes=processes, parallel_min_donors=0)
+            stats = {}
+            # Warm-up: starts the pool and faults the columns into memory
+            snapshot.search(*queries[0], args.radius, args.blood_group, limit, stats=stats)
+            results = []
+            start = time.perf_counter()
+            for lat, lon in queries:
+                results.append(snapshot.search(lat, lon, args.radius, args.blood_group, limit, stats=stats))
+            elapsed = time.perf_counter() - start
+            snapshot.close()
+
+            if baseline is None:
+                baseline = (elapsed, results)
+            report['runs'].append({
+                'processes': processes,
+                'ms_per_query': round(elapsed / args.queries * 1000, 2),
+                'speedup': round(baseline[0] / elapsed, 2),
+                'identical_results': results == baseline[1],
+                'scanned_last_query': stats['scanned'],
+            })
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
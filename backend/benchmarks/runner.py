@@ -0,0 +1,302 @@
+"""Load benchmark for the search and registration endpoints.
+
+Populates a throwaway database with synthetic donors, then drives
+/api/donors, /api/donors/nearby, /api/donors/nearby/batch and /api/register
+through the Flask test
+client at a fixed concurrency and reports latency percentiles, throughput
+and peak RSS as JSON. With --serve the requests go over HTTP to a gunicorn
+server started for the run instead, to compare serving modes:
+
+    python -m benchmarks --donors 100000 --concurrency 8 --requests 2000
+    python -m benchmarks --serve asgi --concurrency 32 --scenarios donors,nearby
+"""
+import argparse
+import contextlib
+import http.client
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+from benchmarks.generator import DISTRICT_CENTROIDS, generate_donors
+
+SCENARIOS = ('donors', 'nearby', 'nearby_batch', 'register', 'mixed')
+# Request mix for the mixed scenario: mostly searches, one registration in five.
+# Its searches fetch one page of MIXED_PAGE_SIZE, so lock waits show up rather than JSON encoding.
+MIXED = ('donors', 'nearby', 'donors', 'nearby', 'register')
+MIXED_PAGE_SIZE = 20
+INSERT_CHUNK = 10000
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# gunicorn command lines for --serve; settings come from gunicorn.conf.py and --env
+SERVERS = {
+    'sync': ['gunicorn', 'app:app'],  # the original deployment: one sync worker
+    'gthread': ['gunicorn', 'app:app', '-c', 'gunicorn.conf.py', '-k', 'gthread'],
+    'asgi': ['gunicorn', 'asgi:app', '-c', 'gunicorn.conf.py', '-k', 'uvicorn.workers.UvicornWorker'],
+}
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def peak_rss_mb():
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    return round(usage / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def populate(api, count, seed):
+    from sqlalchemy import insert
+    start = time.perf_counter()
+    with api.app.app_context():
+        api.init_db()
+        donors = generate_donors(count, seed)
+        while True:
+            rows = []
+            for donor in donors:
+                rows.append({
+                    'name': donor['name'],
+                    'email': donor['email'],
+                    'phone': donor['phone'],
+                    'blood_group': donor['bloodGroup'],
+                    'District': donor['District'],
+                    'district_norm': api.normalize_district(donor['District']),
+                    'latitude': donor['latitude'],
+                    'longitude': donor['longitude'],
+                })
+                if len(rows) == INSERT_CHUNK:
+                    break
+            if not rows:
+                break
+            api.db.session.execute(insert(api.User), rows)
+            api.bump_data_version(api.db.session)
+            api.db.session.commit()
+    return round(time.perf_counter() - start, 2)
+
+
+def request_factory(scenario, seed, batch_size=10):
+    rng = random.Random(seed)
+    districts = list(DISTRICT_CENTROIDS)
+    groups = ['O+', 'B+', 'A+', 'AB+', 'O-', 'B-', 'A-', 'AB-']
+    counter = iter(range(10 ** 9))
+    lock = threading.Lock()
+    # Registrations from other scenarios, or from earlier runs against the same
+    # --database-url, must not reuse an email and get a 409
+    prefix = f'{uuid.uuid4().hex[:8]}-{scenario}-{seed}'
+
+    def nearby_query():
+        with lock:
+            District = rng.choice(districts)
+            blood_group = rng.choice(groups)
+            jitter = rng.uniform(-0.05, 0.05), rng.uniform(-0.05, 0.05)
+        lat, lon = DISTRICT_CENTROIDS[District]
+        return {'bloodGroup': blood_group, 'latitude': round(lat + jitter[0], 4),
+                'longitude': round(lon + jitter[1], 4), 'radius': 10}
+
+    def next_request(scenario=scenario):
+        if scenario == 'mixed':
+            with lock:
+                choice = rng.choice(MIXED)
+            method, path, kwargs = next_request(choice)
+            if method == 'GET':
+                kwargs['query_string']['limit'] = MIXED_PAGE_SIZE
+            return method, path, kwargs
+        if scenario == 'nearby':
+            return 'GET', '/api/donors/nearby', {'query_string': nearby_query()}
+        if scenario == 'nearby_batch':
+            return 'POST', '/api/donors/nearby/batch', {'json': {
+                'queries': [nearby_query() for _ in range(batch_size)]}}
+        with lock:
+            District = rng.choice(districts)
+            blood_group = rng.choice(groups)
+            jitter = rng.uniform(-0.05, 0.05), rng.uniform(-0.05, 0.05)
+            number = next(counter)
+        lat, lon = DISTRICT_CENTROIDS[District]
+        if scenario == 'donors':
+            return 'GET', '/api/donors', {'query_string': {'bloodGroup': blood_group, 'District': District}}
+        return 'POST', '/api/register', {'json': {
+            'name': f'Bench {seed}-{number}', 'email': f'bench-{prefix}-{number}@bench.example.com',
+            'phone': '9000000000', 'bloodGroup': blood_group, 'District': District,
+            'latitude': lat + jitter[0], 'longitude': lon + jitter[1]}}
+
+    return next_request
+
+
+@contextlib.contextmanager
+def serve(mode, port):
+    """Run a gunicorn server for the benchmark on 127.0.0.1:port."""
+    command = SERVERS[mode] + ['--bind', f'127.0.0.1:{port}']
+    server = subprocess.Popen(command, cwd=BACKEND_DIR, stdout=sys.stderr)
+    try:
+        deadline = time.monotonic() + 60
+        while True:
+            try:
+                urllib.request.urlopen(f'http://127.0.0.1:{port}/api/health', timeout=1).read()
+                break
+            except OSError:
+                if server.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError(f"gunicorn ({mode}) did not start")
+                time.sleep(0.2)
+        yield
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def test_client_sender(api):
+    local = threading.local()
+
+    def send(method, path, kwargs):
+        client = getattr(local, 'client', None)
+        if client is None:
+            client = local.client = api.app.test_client()
+        response = client.open(path, method=method, **kwargs)
+        response.get_data()
+        return response.status_code
+
+    return send
+
+
+def http_sender(port):
+    # One keep-alive connection per benchmark thread
+    local = threading.local()
+
+    def send(method, path, kwargs):
+        connection = getattr(local, 'connection', None)
+        if connection is None:
+            connection = local.connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        headers, body = {}, None
+        if 'query_string' in kwargs:
+            path += '?' + urlencode(kwargs['query_string'])
+        if 'json' in kwargs:
+            headers['Content-Type'] = 'application/json'
+            body = json.dumps(kwargs['json'])
+        connection.request(method, path, body, headers)
+        response = connection.getresponse()
+        response.read()
+        return response.status
+
+    return send
+
+
+def run_scenario(send, scenario, total, concurrency, seed, batch_size=10):
+    next_request = request_factory(scenario, seed, batch_size)
+    errors = []
+
+    def one(_):
+        method, path, kwargs = next_request()
+        start = time.perf_counter()
+        status = send(method, path, kwargs)
+        elapsed = time.perf_counter() - start
+        if status >= 400:
+            errors.append(status)
+        return elapsed
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = sorted(pool.map(one, range(total)))
+    wall = time.perf_counter() - started
+    return {
+        'requests': total,
+        'errors': len(errors),
+        'throughput_rps': round(total / wall, 1),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the Blood Donor API endpoints.')
+    parser.add_argument('--donors', type=int, default=10000, help='Synthetic donors to insert (1k-10M).')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=1000, help='Requests per scenario.')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                        help='Comma-separated subset of: ' + ', '.join(SCENARIOS))
+    parser.add_argument('--database-url', help='Defaults to a temporary SQLite file.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--batch-size', type=int, default=10, help='Queries per nearby_batch request.')
+    parser.add_argument('--output', help='Also write the JSON report to this file.')
+    parser.add_argument('--serve', choices=sorted(SERVERS),
+                        help='Send requests over HTTP to gunicorn in this mode instead of the test client.')
+    parser.add_argument('--port', type=int, default=8765, help='Port for --serve.')
+    parser.add_argument('--env', action='append', default=[], metavar='NAME=VALUE',
+                        help='App setting to apply before import, e.g. QUERY_CACHE_MAX_BYTES=0.')
+    args = parser.parse_args(argv)
+    for setting in args.env:
+        if '=' not in setting:
+            parser.error(f"--env expects NAME=VALUE, got {setting!r}")
+    args.scenarios = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    workdir = None
+    if not args.database_url:
+        workdir = tempfile.TemporaryDirectory()
+        args.database_url = 'sqlite:///' + os.path.join(workdir.name, 'bench.db')
+    # Must be set before app is imported
+    os.environ['DATABASE_URL'] = args.database_url
+    for setting in args.env:
+        name, value = setting.split('=', 1)
+        os.environ[name] = value
+
+    # Keep stdout for the JSON report; the app prints startup messages
+    with contextlib.redirect_stdout(sys.stderr):
+        import app as api
+
+        report = {
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'database': args.database_url.split(':', 1)[0],
+            'donors': args.donors,
+            'concurrency': args.concurrency,
+            'batch_size': args.batch_size,
+            'settings': args.env,
+            'server': args.serve or 'test_client',
+            'populate_seconds': populate(api, args.donors, args.seed),
+            'scenarios': {},
+        }
+        with serve(args.serve, args.port) if args.serve else contextlib.nullcontext():
+            send = http_sender(args.port) if args.serve else test_client_sender(api)
+            for scenario in args.scenarios:
+                report['scenarios'][scenario] = run_scenario(
+                    send, scenario, args.requests, args.concurrency, args.seed, args.batch_size)
+        # With --serve this is the load generator's own footprint, not the server's
+        report['peak_rss_mb'] = peak_rss_mb()
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    if workdir is not None:
+        workdir.cleanup()
+    return report
@@ -0,0 +1,81 @@
+"""Per-row cost of ORM hydration + to_dict() versus plain rows + RowSerializer.
+
+    python -m benchmarks.serialization --rows 20000
+"""
+import argparse
+import json
+import os
+import random
+import time
+
+
+def timed(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    # Throwaway database; must be set before app is imported
+    os.environ['DATABASE_URL'] = 'sqlite://'
+    import app as api
+
+    rng = random.Random(42)
+    with api.app.app_context():
+        api.init_db()
+        api.db.session.bulk_save_objects([
+            api.User(f'Donor {i}', f'donor{i}@example.com', f'555-{i:07d}',
+                     rng.choice(['A+', 'A-', 'B+', 'B-', 'AB+', 'AB-', 'O+', 'O-']),
+                     rng.choice(['Pune', 'Mumbai City', 'Nagpur']),
+                     rng.uniform(8, 35), rng.uniform(68, 97))
+            for i in range(args.rows)
+        ])
+        api.db.session.commit()
+
+        def orm_path():
+            users = api.User.query.all()
+            body = api.jsonify([user.to_dict() for user in users]).get_data()
+            api.db.session.expunge_all()
+            return body
+
+        def lean_path():
+            rows = api.db.session.query(*api.DONOR_COLUMNS).all()
+            return (api.donor_serializer.encode_rows(rows) + '\n').encode()
+
+        rows = api.db.session.query(*api.DONOR_COLUMNS).all()
+
+        def encode_dicts():
+            dicts = [api.donor_serializer.to_dict(row) for row in rows]
+            return json.dumps(dicts, sort_keys=True, separators=(',', ':'))
+
+        def encode_rows():
+            return api.donor_serializer.encode_rows(rows)
+
+        orm_time, orm_body = timed(orm_path, args.repeat)
+        lean_time, lean_body = timed(lean_path, args.repeat)
+        dict_time, _ = timed(encode_dicts, args.repeat)
+        row_time, _ = timed(encode_rows, args.repeat)
+
+    report = {
+        'rows': args.rows,
+        'identical_output': orm_body == lean_body,
+        'orm_us_per_row': round(orm_time / args.rows * 1e6, 3),
+        'lean_us_per_row': round(lean_time / args.rows * 1e6, 3),
+        'end_to_end_speedup': round(orm_time / lean_time, 2),
+        'dict_json_dumps_us_per_row': round(dict_time / args.rows * 1e6, 3),
+        'row_serializer_us_per_row': round(row_time / args.rows * 1e6, 3),
+        'encode_speedup': round(dict_time / row_time, 2),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
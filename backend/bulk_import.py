@@ -0,0 +1,152 @@
+import csv
+import json
+from itertools import islice
+
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+
+from distance_engine import valid_coordinates
+
+DEFAULT_CHUNK_SIZE = 1000
+COORDINATES_ERROR = "Latitude must be between -90 and 90 and longitude between -180 and 180"
+FORMATS = ('csv', 'ndjson')
+
+
+def iter_records(stream, fmt):
+    """Yield (row_number, record, error) from a CSV or NDJSON text stream.
+
+    Rows are numbered from 1, not counting the CSV header. record is a dict
+    with the /api/register field names, or None when the line is unreadable.
+    """
+    if fmt == 'csv':
+        for number, record in enumerate(csv.DictReader(stream), start=1):
+            yield number, record, None
+    elif fmt == 'ndjson':
+        number = 0
+        for line in stream:
+            if not line.strip():
+                continue
+            number += 1
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield number, None, f"Invalid JSON: {e}"
+                continue
+            if not isinstance(record, dict):
+                yield number, None, "Each line must be a JSON object"
+                continue
+            yield number, record, None
+    else:
+        raise ValueError(f"Unsupported format: {fmt}")
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class BulkImporter:
+    """Validates and inserts donor records in fixed-size chunks.
+
+    Each chunk costs one query for already-registered emails and one
+    executemany INSERT, regardless of how many rows it holds. validate is the
+    /api/register validation function; normalize_district fills the
+    district_norm column. before_commit, if given, is called with the
+    session just before each transaction that inserts commits.
+    """
+
+    def __init__(self, session, model, validate, normalize_district, chunk_size=DEFAULT_CHUNK_SIZE,
+                 before_commit=None):
+        self.session = session
+        self.model = model
+        self.validate = validate
+        self.normalize_district = normalize_district
+        self.chunk_size = chunk_size
+        self.before_commit = before_commit
+        self.report = {'processed': 0, 'inserted': 0, 'failed': 0, 'errors': []}
+
+    def _fail(self, number, record, error):
+        entry = {'row': number, 'error': error}
+        if record and record.get('email'):
+            entry['email'] = record['email']
+        self.report['errors'].append(entry)
+        self.report['failed'] += 1
+
+    def _to_row(self, record):
+        row = {
+            'name': record['name'],
+            'email': record['email'],
+            'phone': record['phone'],
+            'blood_group': record['bloodGroup'],
+            'District': record['District'],
+            'district_norm': self.normalize_district(record['District']),
+            'latitude': float(record['latitude']),
+            'longitude': float(record['longitude']),
+        }
+        if not valid_coordinates(row['latitude'], row['longitude']):
+            raise ValueError("Coordinates out of range")
+        return row
+
+    def import_records(self, records):
+        """Import (row_number, record, error) tuples; returns the report."""
+        for chunk in chunked(records, self.chunk_size):
+            self._import_chunk(chunk)
+        self.report['errors'].sort(key=lambda entry: entry['row'])
+        return self.report
+
+    def _import_chunk(self, chunk):
+        pending = {}
+        for number, record, error in chunk:
+            self.report['processed'] += 1
+            if error is None:
+                error = self.validate(record)
+            if error is None:
+                try:
+                    row = self._to_row(record)
+                except (TypeError, ValueError):
+                    error = COORDINATES_ERROR
+            if error is None and row['email'] in pending:
+                error = "Duplicate email in import"
+            if error:
+                self._fail(number, record, error)
+            else:
+                pending[row['email']] = (number, row)
+        if not pending:
+            return
+
+        email = self.model.email
+        existing = self.session.execute(select(email).where(email.in_(list(pending)))).scalars()
+        for address in existing:
+            number, row = pending.pop(address)
+            self._fail(number, row, "Email already registered")
+        if not pending:
+            return
+
+        rows = [row for _, row in pending.values()]
+        try:
+            self.session.execute(insert(self.model), rows)
+            self._commit_insert()
+            self.report['inserted'] += len(rows)
+        except IntegrityError:
+            # Lost a race with a concurrent registration; retry rows one at a time
+            self.session.rollback()
+            self._insert_one_by_one(pending.values())
+
+    def _commit_insert(self):
+        if self.before_commit is not None:
+            self.before_commit(self.session)
+        self.session.commit()
+
+    def _insert_one_by_one(self, numbered_rows):
+        for number, row in numbered_rows:
+            try:
+                with self.session.begin_nested():
+                    self.session.execute(insert(self.model), [row])
+                self.report['inserted'] += 1
+            except IntegrityError:
+                self._fail(number, row, "Email already registered")
+        self._commit_insert()
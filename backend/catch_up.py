@@ -0,0 +1,62 @@
+import os
+import threading
+import time
+
+from sqlalchemy import or_
+
+# Ids this far below the newest one may still belong to uncommitted inserts;
+# the default covers the largest bulk-import chunk
+CATCH_UP_WINDOW = int(os.environ.get('CATCH_UP_WINDOW', 10000))
+# How long a skipped id is looked for before it is taken to be rolled back or deleted
+CATCH_UP_MAX_AGE = float(os.environ.get('CATCH_UP_MAX_AGE', 60))
+
+
+def settled_max_id(max_id):
+    """The highest id below which every insert has committed, going by CATCH_UP_WINDOW."""
+    return max(max_id - CATCH_UP_WINDOW, 0)
+
+
+class CatchUp:
+    """Which donor ids an in-memory copy of the users table has seen.
+
+    Rows become visible in commit order, not id order: on PostgreSQL the
+    transaction holding id 11 can commit after the one holding id 12, and
+    "id > max_id" alone would then skip 11 for good. Ids passed over within
+    window of max_id are kept as gaps for max_age seconds, and where()
+    fetches them along with newer rows. Gaps that never fill (rolled-back
+    inserts, deleted rows) expire. With SQLite, writers are serialized and
+    gaps only come from those.
+    """
+
+    def __init__(self, max_id=0, window=CATCH_UP_WINDOW, max_age=CATCH_UP_MAX_AGE):
+        self.max_id = max_id
+        self.window = window
+        self.max_age = max_age
+        self._gaps = {}  # id -> time.monotonic() when it was passed over
+        self._lock = threading.Lock()
+
+    def see(self, donor_id):
+        """Record donor_id; returns False if it had been seen already."""
+        with self._lock:
+            if donor_id > self.max_id:
+                now = time.monotonic()
+                for missing in range(max(self.max_id + 1, donor_id - self.window), donor_id):
+                    self._gaps[missing] = now
+                self.max_id = donor_id
+                return True
+            return self._gaps.pop(donor_id, None) is not None
+
+    def gaps(self):
+        with self._lock:
+            expired = time.monotonic() - self.max_age
+            floor = self.max_id - self.window
+            for donor_id in [donor_id for donor_id, since in self._gaps.items()
+                             if since < expired or donor_id <= floor]:
+                del self._gaps[donor_id]
+            return sorted(self._gaps)
+
+    def where(self, id_column):
+        """SQL criterion for rows not seen yet."""
+        gaps = self.gaps()
+        newer = id_column > self.max_id
+        return or_(newer, id_column.in_(gaps)) if gaps else newer
@@ -0,0 +1,22 @@
+# Red-cell compatibility: recipient blood group -> donor groups it can receive
+# from. The recipient's own group comes first so exact matches rank ahead.
+COMPATIBLE_DONORS = {
+    'A+': ('A+', 'A-', 'O+', 'O-'),
+    'A-': ('A-', 'O-'),
+    'B+': ('B+', 'B-', 'O+', 'O-'),
+    'B-': ('B-', 'O-'),
+    'AB+': ('AB+', 'AB-', 'A+', 'A-', 'B+', 'B-', 'O+', 'O-'),
+    'AB-': ('AB-', 'A-', 'B-', 'O-'),
+    'O+': ('O+', 'O-'),
+    'O-': ('O-',),
+}
+
+
+def compatible_groups(recipient):
+    """Donor groups compatible with recipient, exact match first; None if unknown."""
+    return COMPATIBLE_DONORS.get(recipient)
+
+
+def match_rank(recipient, donor_group):
+    """0 for an exact blood-group match, 1 for any other compatible group."""
+    return 0 if donor_group == recipient else 1
@@ -0,0 +1,29 @@
+import functools
+
+from flask import g
+from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
+
+READ_BIND = 'read'
+
+
+class RoutingSession(Session):
+    """Uses the 'read' engine, when SQLALCHEMY_BINDS has one, inside read_only views."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and g.get('read_only') and READ_BIND in self._db.engines:
+            return self._db.engines[READ_BIND]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def read_only(view):
+    """Run a view's queries on the read-only connection pool."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        g.read_only = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+# Bound to an app by create_app() in app.py
+db = SQLAlchemy(session_options={'class_': RoutingSession})
@@ -0,0 +1,174 @@
+import heapq
+import math
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional; the scalar haversine is the fallback
+    np = None
+
+EARTH_RADIUS_KM = 6371
+
+
+def valid_coordinates(latitude, longitude):
+    """Whether latitude and longitude are numbers on the globe (not NaN or infinite)."""
+    try:
+        return -90 <= latitude <= 90 and -180 <= longitude <= 180
+    except TypeError:
+        return False
+
+
+def calculate_distance(lat1, lon1, lat2, lon2):
+    R = EARTH_RADIUS_KM
+    dLat = math.radians(lat2 - lat1)
+    dLon = math.radians(lon2 - lon1)
+    a = (math.sin(dLat/2)**2 +
+         math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) *
+         math.sin(dLon/2)**2)
+    return R * (2 * math.atan2(math.sqrt(a), math.sqrt(1-a)))
+
+
+def haversine_many(lat, lon, lats, lons):
+    """Vectorized calculate_distance from one point to arrays of points."""
+    dLat = np.radians(lats - lat)
+    dLon = np.radians(lons - lon)
+    a = (np.sin(dLat/2)**2 +
+         math.cos(math.radians(lat)) * np.cos(np.radians(lats)) *
+         np.sin(dLon/2)**2)
+    return EARTH_RADIUS_KM * (2 * np.arctan2(np.sqrt(a), np.sqrt(1-a)))
+
+
+def select_matches(ids, distances, radius, limit=None, after=None):
+    """sorted_matches() as (ids, distances) arrays."""
+    keep = distances <= radius
+    if after is not None:
+        after_distance, after_id = after
+        keep &= (distances > after_distance) | ((distances == after_distance) & (ids > after_id))
+    ids, distances = ids[keep], distances[keep]
+    if limit is not None and len(distances) > limit:
+        # Partial selection: only the nearest `limit` (plus boundary ties) get sorted
+        kth = np.partition(distances, limit - 1)[limit - 1]
+        near = distances <= kth
+        ids, distances = ids[near], distances[near]
+    order = np.lexsort((ids, distances))[:limit]
+    return ids[order], distances[order]
+
+
+def sorted_matches(ids, distances, radius, limit=None, after=None):
+    ids, distances = select_matches(ids, distances, radius, limit, after)
+    return list(zip(ids.tolist(), distances.tolist()))
+
+
+def nearest_within(latitude, longitude, radius, rows, limit=None, after=None):
+    """Filter (id, latitude, longitude) rows to radius km.
+
+    Returns (id, distance) pairs ordered by distance, then id. With limit only
+    the nearest `limit` are returned; after is a (distance, id) keyset cursor.
+    """
+    if np is None:
+        matches = []
+        for donor_id, lat, lon in rows:
+            dist = calculate_distance(latitude, longitude, lat, lon)
+            if dist <= radius and (after is None or (dist, donor_id) > after):
+                matches.append((dist, donor_id))
+        matches = sorted(matches) if limit is None else heapq.nsmallest(limit, matches)
+        return [(donor_id, dist) for dist, donor_id in matches]
+
+    rows = list(rows)
+    if not rows:
+        return []
+    ids, lats, lons = zip(*rows)
+    ids = np.array(ids, dtype=np.int64)
+    distances = haversine_many(latitude, longitude,
+                               np.array(lats, dtype=np.float64),
+                               np.array(lons, dtype=np.float64))
+    return sorted_matches(ids, distances, radius, limit, after)
+
+
+class DonorCoordinates:
+    """Append-only columnar store of donor ids, coordinates and blood groups.
+
+    With numpy the columns are contiguous int64/float64/uint8 arrays grown by
+    doubling; blood groups are stored as small integer codes so a group mask
+    is one vectorized comparison. Without numpy plain lists are used.
+    """
+
+    def __init__(self, capacity=1024):
+        self.size = 0
+        self.group_codes = {}
+        if np is None:
+            self.ids, self.lats, self.lons, self.groups = [], [], [], []
+        else:
+            self.ids = np.empty(capacity, dtype=np.int64)
+            self.lats = np.empty(capacity, dtype=np.float64)
+            self.lons = np.empty(capacity, dtype=np.float64)
+            self.groups = np.empty(capacity, dtype=np.uint8)
+
+    def _group_code(self, blood_group):
+        code = self.group_codes.get(blood_group)
+        if code is None:
+            if len(self.group_codes) > 255:
+                raise ValueError('Too many distinct blood groups')
+            code = self.group_codes[blood_group] = len(self.group_codes)
+        return code
+
+    def _grow(self):
+        capacity = max(len(self.ids) * 2, 1024)
+        for name in ('ids', 'lats', 'lons', 'groups'):
+            column = getattr(self, name)
+            grown = np.empty(capacity, dtype=column.dtype)
+            grown[:self.size] = column[:self.size]
+            setattr(self, name, grown)
+
+    def append(self, donor_id, blood_group, latitude, longitude):
+        """Store one donor and return its position."""
+        code = self._group_code(blood_group)
+        position = self.size
+        if np is None:
+            self.ids.append(donor_id)
+            self.lats.append(latitude)
+            self.lons.append(longitude)
+            self.groups.append(code)
+        else:
+            if position == len(self.ids):
+                self._grow()
+            self.ids[position] = donor_id
+            self.lats[position] = latitude
+            self.lons[position] = longitude
+            self.groups[position] = code
+        self.size += 1
+        return position
+
+    def group_mask(self, blood_group, size=None):
+        """Boolean mask over the first size (default: all) stored donors; numpy only."""
+        if size is None:
+            size = self.size
+        code = self.group_codes.get(blood_group)
+        if code is None:
+            return np.zeros(size, dtype=bool)
+        return self.groups[:size] == code
+
+    def within(self, latitude, longitude, radius, positions, limit=None, after=None):
+        """Distances from a point to the donors at positions, nearest first."""
+        if np is None:
+            return nearest_within(latitude, longitude, radius,
+                                  ((self.ids[p], self.lats[p], self.lons[p]) for p in positions),
+                                  limit, after)
+        positions = np.asarray(positions, dtype=np.intp)
+        distances = haversine_many(latitude, longitude, self.lats[positions], self.lons[positions])
+        return sorted_matches(self.ids[positions], distances, radius, limit, after)
+
+    def scan(self, latitude, longitude, radius, blood_group=None, min_lat=-90.0, max_lat=90.0,
+             limit=None, after=None, stats=None):
+        """Vectorized pass over every stored donor, for searches wider than the grid helps with."""
+        # Searches run without the index lock: size is read once, so a donor
+        # appended meanwhile is left out of every column rather than just some
+        size = self.size
+        lats = self.lats[:size]
+        mask = (lats >= min_lat) & (lats <= max_lat)
+        if blood_group:
+            mask &= self.group_mask(blood_group, size)
+        positions = np.flatnonzero(mask)
+        if stats is not None:
+            stats['scanned'] = len(positions)
+        distances = haversine_many(latitude, longitude, lats[positions], self.lons[:size][positions])
+        return sorted_matches(self.ids[:size][positions], distances, radius, limit, after)
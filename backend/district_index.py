@@ -0,0 +1,134 @@
+import bisect
+import re
+from collections import Counter
+
+# Suggestions use the same cut-off as findMatchingDistrict() in the frontend
+SUGGEST_SIMILARITY = 0.6
+FUZZY_CANDIDATES = 20
+
+_SEPARATORS = re.compile(r'[\W_]+')
+
+
+def district_key(name):
+    """Lower-case words separated by single spaces, without punctuation.
+
+    'Medchal–Malkajgiri', 'medchal-malkajgiri' and ' MEDCHAL  MALKAJGIRI'
+    all give 'medchal malkajgiri'.
+    """
+    return ' '.join(word for word in _SEPARATORS.split(name.casefold()) if word)
+
+
+def trigrams(key):
+    padded = f'  {key} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(a, b):
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, start=1):
+        current = [i]
+        for j, char_b in enumerate(b, start=1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        previous = current
+    return previous[-1]
+
+
+def similarity(a, b, threshold=0.0):
+    """1 - edit distance / longer length, or 0.0 when it cannot exceed threshold."""
+    longest = max(len(a), len(b))
+    if not longest:
+        return 1.0
+    # The length difference alone is a lower bound on the edit distance
+    if 1 - abs(len(a) - len(b)) / longest <= threshold:
+        return 0.0
+    return 1 - edit_distance(a, b) / longest
+
+
+class DistrictIndex:
+    """Canonical district names with exact, prefix and trigram lookups.
+
+    Every structure is built once from the name list, so canonicalize() and
+    suggest() look up or intersect small candidate sets instead of running
+    string comparisons against every district.
+    """
+
+    def __init__(self, names):
+        self.names = []
+        self._by_key = {}
+        for name in names:
+            key = district_key(name)
+            if key and key not in self._by_key:  # a few districts share a name across states
+                self._by_key[key] = len(self.names)
+                self.names.append(name)
+        self._keys = [district_key(name) for name in self.names]
+
+        # (text from the start of a word to the end of the key, position), sorted
+        # so that all names with a word starting with the query are one bisect away
+        self._prefixes = sorted(
+            (key[match.start():], position)
+            for position, key in enumerate(self._keys)
+            for match in re.finditer(r'\S+', key))
+        self._trigrams = {}
+        for position, key in enumerate(self._keys):
+            for gram in trigrams(key):
+                self._trigrams.setdefault(gram, set()).add(position)
+
+    def canonicalize(self, raw):
+        """The canonical spelling of raw, or None unless it names exactly one district.
+
+        Only case, spacing and punctuation are ignored. Close spellings are
+        often different districts (Kanpur and Kannur, Nagar and Nagaur), so
+        they are left to suggest() for the user to choose from.
+        """
+        position = self._by_key.get(district_key(raw))
+        return None if position is None else self.names[position]
+
+    def _shortlist(self, key):
+        shared = Counter()
+        for gram in trigrams(key):
+            shared.update(self._trigrams.get(gram, ()))
+        return [position for position, _ in shared.most_common(FUZZY_CANDIDATES)]
+
+    def _fuzzy(self, key, threshold):
+        """Positions of names more similar to key than threshold, best first."""
+        scored = [(position, similarity(key, self._keys[position], threshold))
+                  for position in self._shortlist(key)]
+        scored.sort(key=lambda item: (-item[1], item[0]))
+        return [position for position, score in scored if score > threshold]
+
+    def suggest(self, query, limit=10):
+        """Up to limit district names for an autocomplete box.
+
+        Names starting with the query come first, then names with a later
+        word starting with it, then names containing it anywhere, then close
+        misspellings.
+        """
+        key = district_key(query)
+        results, seen = [], set()
+        for tier in self._suggestion_tiers(key):
+            for position in tier:
+                if position not in seen:
+                    seen.add(position)
+                    results.append(self.names[position])
+                    if len(results) == limit:
+                        return results
+        return results
+
+    def _suggestion_tiers(self, key):
+        # Generated lazily: most queries fill the list from the prefix tiers
+        if not key:
+            return
+        leading, word = [], []
+        for i in range(bisect.bisect_left(self._prefixes, (key,)), len(self._prefixes)):
+            suffix, position = self._prefixes[i]
+            if not suffix.startswith(key):
+                break
+            (leading if len(suffix) == len(self._keys[position]) else word).append(position)
+        yield sorted(leading, key=self.names.__getitem__)
+        yield sorted(word, key=self.names.__getitem__)
+        if len(key) < 3:
+            return
+        inner = [self._trigrams.get(key[i:i + 3], set()) for i in range(len(key) - 2)]
+        yield sorted((position for position in set.intersection(*inner) if key in self._keys[position]),
+                     key=self.names.__getitem__)
+        yield self._fuzzy(key, SUGGEST_SIMILARITY)
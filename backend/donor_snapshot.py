@@ -0,0 +1,406 @@
+import json
+import math
+import mmap
+import multiprocessing
+import os
+import struct
+import threading
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor
+
+from distance_engine import haversine_many, np, select_matches, sorted_matches, valid_coordinates
+from spatial_index import bounding_box
+
+try:
+    import fcntl
+except ImportError:  # not on Windows; the append log is skipped there
+    fcntl = None
+
+MAGIC = b'DONORSN1'
+VERSION = 1
+ALIGNMENT = 64
+# Append log record: id, latitude, longitude, blood group (UTF-8, NUL-padded)
+LOG_RECORD = struct.Struct('<qdd8s')
+
+
+def _aligned(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+class CellKeys:
+    """Packs (group code, grid row, grid column) into one sortable int64."""
+
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+        self.row_offset = math.ceil(90 / cell_size) + 1
+        self.col_offset = math.ceil(180 / cell_size) + 1
+        self.rows = 2 * self.row_offset + 1
+        self.cols = 2 * self.col_offset + 1
+
+    def rows_of(self, lats):
+        return np.floor(lats / self.cell_size).astype(np.int64)
+
+    def pack(self, codes, rows, cols):
+        return (codes * self.rows + rows + self.row_offset) * self.cols + cols + self.col_offset
+
+
+def write_snapshot(path, rows, max_id, cell_size=0.1, rewrites=0):
+    """Write (id, blood_group, latitude, longitude) rows, all ids up to max_id, to path.
+
+    rewrites is the database's count of writes that deleted or moved donors
+    when the rows were read; readers stop trusting the snapshot once it
+    grows. Rows are stored sorted by blood group, grid cell and id, so each cell is
+    a contiguous run that the reader finds by binary search. The file is
+    written beside path and renamed over it, so readers never see a partial
+    snapshot; workers that already mapped the old one keep using it.
+    Returns the number of donors written.
+    """
+    rows = [row for row in rows if valid_coordinates(row[2], row[3])]
+    groups = sorted({row[1] for row in rows})
+    if len(groups) > 256:
+        raise ValueError('Too many distinct blood groups')
+    codes_by_group = {group: code for code, group in enumerate(groups)}
+
+    count = len(rows)
+    ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=count)
+    if count and ids.max() > np.iinfo(np.int32).max:
+        raise ValueError('Donor ids no longer fit the int32 snapshot column')
+    lats = np.fromiter((row[2] for row in rows), dtype=np.float64, count=count)
+    lons = np.fromiter((row[3] for row in rows), dtype=np.float64, count=count)
+    codes = np.fromiter((codes_by_group[row[1]] for row in rows), dtype=np.uint8, count=count)
+
+    cells = CellKeys(cell_size)
+    keys = cells.pack(codes.astype(np.int64), cells.rows_of(lats), cells.rows_of(lons))
+    order = np.lexsort((ids, keys))
+    keys = keys[order]
+    cell_keys, cell_starts = np.unique(keys, return_index=True)
+    columns = {
+        'ids': ids[order].astype(np.int32),
+        'lats': lats[order],
+        'lons': lons[order],
+        'codes': codes[order],
+        'cell_keys': cell_keys,
+        'cell_starts': np.append(cell_starts, count).astype(np.int64),
+    }
+
+    header = {
+        'version': VERSION,
+        'count': count,
+        'max_id': max_id,
+        'rewrites': rewrites,
+        'cell_size': cell_size,
+        'groups': groups,
+        'columns': {},
+    }
+    # Column offsets are relative to the first aligned byte after the header
+    offset = 0
+    for name, column in columns.items():
+        header['columns'][name] = [str(column.dtype), offset, len(column)]
+        offset = _aligned(offset + column.nbytes)
+    encoded = json.dumps(header).encode()
+    data_start = _aligned(len(MAGIC) + 4 + len(encoded))
+
+    temporary = f'{path}.tmp{os.getpid()}'
+    with open(temporary, 'wb') as f:
+        f.write(MAGIC + struct.pack('<I', len(encoded)) + encoded)
+        for name, column in columns.items():
+            f.seek(data_start + header['columns'][name][1])
+            f.write(column.tobytes())
+        f.truncate(data_start + offset)
+    os.replace(temporary, path)
+    return count
+
+
+class DonorSnapshot:
+    """Read-only, memory-mapped donor snapshot written by write_snapshot().
+
+    The columns are numpy views straight onto the mapped file, so opening
+    one costs a header parse and every worker process shares the same page
+    cache copy. search() has the same contract as DonorSpatialIndex.search()
+    and serves as that index's base. Rows registered after the snapshot are
+    kept in an append log beside it (see DonorLog).
+
+    With processes > 1, searches that would measure at least
+    parallel_min_donors donors are cut into that many shards of contiguous
+    positions (neighbouring cells of one blood group, since rows are stored in
+    cell order), which a pool of processes each mapping the same file
+    measures in parallel. Smaller searches stay inline, where handing work
+    to another process would cost more than it saves.
+    """
+
+    def __init__(self, path, processes=0, parallel_min_donors=50000):
+        self.path = path
+        self.processes = processes
+        self.parallel_min_donors = parallel_min_donors
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._stale = False  # replaced on disk since this process mapped it
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a donor snapshot")
+        (length,) = struct.unpack_from('<I', self._map, len(MAGIC))
+        start = len(MAGIC) + 4
+        header = json.loads(self._map[start:start + length])
+        if header['version'] != VERSION:
+            raise ValueError(f"Unsupported donor snapshot version {header['version']}")
+
+        self.size = header['count']
+        self.max_id = header['max_id']
+        # Snapshots written before this was recorded count as taken before any rewrite
+        self.rewrites = header.get('rewrites', 0)
+        self.cell_size = header['cell_size']
+        self.groups = header['groups']
+        self.group_codes = {group: code for code, group in enumerate(self.groups)}
+        self._cells = CellKeys(self.cell_size)
+        data_start = _aligned(start + length)
+        for name, (dtype, offset, count) in header['columns'].items():
+            setattr(self, name, np.frombuffer(self._map, dtype=dtype, count=count, offset=data_start + offset))
+        self.log = DonorLog(path + '.log')
+
+    @classmethod
+    def open(cls, path, **kwargs):
+        """The snapshot at path, or None when there is none (or numpy is missing)."""
+        if np is None or not path or not os.path.exists(path):
+            return None
+        return cls(path, **kwargs)
+
+    def search(self, latitude, longitude, radius, blood_group=None, limit=None, after=None, stats=None):
+        plan = self._plan(latitude, longitude, radius, blood_group)
+        if plan is None:
+            if stats is not None:
+                stats['scanned'] = 0
+            return []
+        runs, code, bounds = plan
+        query = (latitude, longitude, radius, code, bounds, limit, after)
+
+        shards = None
+        if self.processes > 1 and sum(end - start for start, end in runs) >= self.parallel_min_donors:
+            shards = self._search_parallel(runs, query)
+        if shards is None:
+            shards = [self.match(runs, *query)]
+
+        if stats is not None:
+            stats['scanned'] = sum(scanned for scanned, _, _ in shards)
+        if len(shards) == 1:
+            _, ids, distances = shards[0]
+            return list(zip(ids.tolist(), distances.tolist()))
+        # Each shard's nearest `limit` are sorted already; re-select across them
+        ids = np.concatenate([ids for _, ids, _ in shards])
+        distances = np.concatenate([distances for _, _, distances in shards])
+        return sorted_matches(ids, distances, radius, limit)
+
+    def _plan(self, latitude, longitude, radius, blood_group):
+        """(runs, code, bounds) to scan for a search, or None when nothing can match.
+
+        runs are (start, end) position ranges. Narrow searches get one run per
+        (group, row, column range) and need no filtering; wide searches get the
+        whole snapshot, filtered to bounds = (min_lat, max_lat) and, when code
+        is not None, to one blood group.
+        """
+        if blood_group:
+            codes = [self.group_codes[blood_group]] if blood_group in self.group_codes else []
+        else:
+            codes = list(range(len(self.groups)))
+        if not codes or not self.size:
+            return None
+
+        min_lat, max_lat, lon_ranges = bounding_box(latitude, longitude, radius)
+        cell_rows = np.arange(math.floor(min_lat / self.cell_size), math.floor(max_lat / self.cell_size) + 1)
+        col_ranges = [(math.floor(min_lon / self.cell_size), math.floor(max_lon / self.cell_size))
+                      for min_lon, max_lon in lon_ranges]
+        span = len(codes) * len(cell_rows) * sum(hi - lo + 1 for lo, hi in col_ranges)
+
+        if span > len(self.cell_keys):
+            # Wide searches: one vectorized pass beats probing every cell
+            return [(0, self.size)], codes[0] if blood_group else None, (min_lat, max_lat)
+
+        # Each (group, row) is one contiguous run of cells per column range
+        group_codes = np.repeat(np.asarray(codes, dtype=np.int64), len(cell_rows))
+        rows = np.tile(cell_rows, len(codes))
+        runs = []
+        for lo, hi in col_ranges:
+            first = np.searchsorted(self.cell_keys, self._cells.pack(group_codes, rows, lo), 'left')
+            last = np.searchsorted(self.cell_keys, self._cells.pack(group_codes, rows, hi), 'right')
+            runs.extend((start, end) for start, end in zip(self.cell_starts[first].tolist(),
+                                                           self.cell_starts[last].tolist())
+                        if start < end)
+        return runs, None, None
+
+    def match(self, runs, latitude, longitude, radius, code=None, bounds=None, limit=None, after=None):
+        """(scanned, ids, distances) for the donors in runs, nearest `limit` first."""
+        if bounds is None:
+            positions = np.concatenate([np.arange(start, end) for start, end in runs]
+                                       or [np.empty(0, dtype=np.int64)])
+        else:
+            min_lat, max_lat = bounds
+            found = []
+            for start, end in runs:
+                lats = self.lats[start:end]
+                mask = (lats >= min_lat) & (lats <= max_lat)
+                if code is not None:
+                    mask &= self.codes[start:end] == code
+                found.append(np.flatnonzero(mask) + start)
+            positions = np.concatenate(found or [np.empty(0, dtype=np.int64)])
+        distances = haversine_many(latitude, longitude, self.lats[positions], self.lons[positions])
+        ids, distances = select_matches(self.ids[positions].astype(np.int64), distances, radius, limit, after)
+        return len(positions), ids, distances
+
+    def _search_parallel(self, runs, query):
+        """Per-shard match() results from the process pool, or None to search inline."""
+        if self._stale:
+            return None
+        pool = self._get_pool()
+        snapshot = (self.max_id, self.size)
+        try:
+            futures = [pool.submit(_match_shard, snapshot, shard, query)
+                       for shard in split_runs(runs, self.processes)]
+        except RuntimeError:
+            # Shut down by another thread since _get_pool() returned it
+            return None
+        try:
+            return [future.result() for future in futures]
+        except StaleSnapshot:
+            # The file was replaced after this process mapped it. New workers would map
+            # the replacement too, so search inline until this process reopens it
+            self._discard_pool(pool, stale=True)
+            return None
+        except BrokenExecutor:
+            # A worker died; the next large search starts a new pool
+            self._discard_pool(pool)
+            return None
+
+    def _discard_pool(self, pool, stale=False):
+        with self._pool_lock:
+            if self._pool is pool:
+                self._pool = None
+            self._stale = self._stale or stale
+        # Searches still running on it finish; its idle workers exit
+        pool.shutdown(wait=False)
+
+    def _get_pool(self):
+        with self._pool_lock:
+            if self._pool is None:
+                # spawn, not fork: the web server calling this runs threads
+                self._pool = ProcessPoolExecutor(self.processes, mp_context=multiprocessing.get_context('spawn'),
+                                                 initializer=_open_worker_snapshot, initargs=(self.path,))
+            return self._pool
+
+    def close(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False)
+                self._pool = None
+
+
+def split_runs(runs, parts):
+    """Cut (start, end) runs into up to `parts` lists holding about as many positions each."""
+    total = sum(end - start for start, end in runs)
+    target = max(-(-total // parts), 1)
+    shards, shard, room = [], [], target
+    for start, end in runs:
+        while end - start > room:
+            shard.append((start, start + room))
+            shards.append(shard)
+            start += room
+            shard, room = [], target
+        if start < end:
+            shard.append((start, end))
+            room -= end - start
+    if shard:
+        shards.append(shard)
+    return shards
+
+
+class StaleSnapshot(Exception):
+    pass
+
+
+_worker_snapshot = None
+
+
+def _open_worker_snapshot(path):
+    global _worker_snapshot
+    _worker_snapshot = DonorSnapshot(path)
+
+
+def _match_shard(snapshot, runs, query):
+    # Pool processes map the file by path, so make sure it is the caller's snapshot
+    if (_worker_snapshot.max_id, _worker_snapshot.size) != snapshot:
+        raise StaleSnapshot(_worker_snapshot.path)
+    return _worker_snapshot.match(runs, *query)
+
+
+class DonorLog:
+    """Fixed-size (id, latitude, longitude, blood group) records in id order.
+
+    Whichever worker first syncs new rows from the database appends them, so
+    a worker starting later reads them from here instead of querying for
+    them. Writers hold an exclusive flock and only append ids past the last
+    record; rows with a blood group longer than 8 bytes end the append, and
+    callers pick them up from the database instead. So are rows that
+    committed after a higher id was logged: the index loading the log sees
+    their ids as gaps (see catch_up.CatchUp) and fetches them.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def rows(self, after_id=0):
+        """(id, blood_group, latitude, longitude) rows with ids above after_id."""
+        if fcntl is None or not os.path.exists(self.path):
+            return []
+        with open(self.path, 'rb') as f:
+            fcntl.flock(f, fcntl.LOCK_SH)
+            data = f.read()
+        usable = len(data) - len(data) % LOG_RECORD.size
+        rows = []
+        for donor_id, latitude, longitude, group in LOG_RECORD.iter_unpack(data[:usable]):
+            if donor_id > after_id:
+                rows.append((donor_id, group.rstrip(b'\0').decode(), latitude, longitude))
+        return rows
+
+    def append(self, rows):
+        """Log (id, blood_group, latitude, longitude) rows sorted by id."""
+        if fcntl is None or not rows:
+            return
+        with open(self.path, 'ab+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            size = f.seek(0, os.SEEK_END)
+            size -= size % LOG_RECORD.size
+            last_id = 0
+            if size:
+                f.seek(size - LOG_RECORD.size)
+                last_id = LOG_RECORD.unpack(f.read(LOG_RECORD.size))[0]
+            records = []
+            for donor_id, blood_group, latitude, longitude in rows:
+                if donor_id <= last_id or not valid_coordinates(latitude, longitude):
+                    continue
+                group = blood_group.encode()
+                if len(group) > 8:
+                    break
+                records.append(LOG_RECORD.pack(donor_id, latitude, longitude, group))
+            f.truncate(size)
+            f.write(b''.join(records))
+
+    def clear(self):
+        """Drop every record, as when donors were deleted or moved since they were logged."""
+        if fcntl is None or not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            f.truncate(0)
+
+    def compact(self, max_id):
+        """Drop records a new snapshot up to max_id already holds."""
+        if fcntl is None or not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            data = f.read()
+            usable = len(data) - len(data) % LOG_RECORD.size
+            keep = [data[i:i + LOG_RECORD.size] for i in range(0, usable, LOG_RECORD.size)
+                    if LOG_RECORD.unpack_from(data, i)[0] > max_id]
+            f.seek(0)
+            f.write(b''.join(keep))
+            f.truncate()
+
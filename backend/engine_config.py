@@ -0,0 +1,113 @@
+import os
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'postgres': 'postgresql+asyncpg',
+    'postgresql': 'postgresql+asyncpg',
+}
+
+
+def _is_memory_sqlite(url):
+    return url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+
+
+def engine_options(database_url, async_engine=False):
+    """Connection pool settings for create_engine/create_async_engine.
+
+    DB_POOL_SIZE connections are kept open per process and up to
+    DB_MAX_OVERFLOW more are opened under load; a request waits at most
+    DB_POOL_TIMEOUT seconds for one. DB_POOL_PRE_PING=1 tests connections
+    before use and DB_POOL_RECYCLE replaces them after that many seconds
+    (-1 keeps them forever). In-memory SQLite gets no options, since every
+    connection there is a separate database.
+    """
+    url = make_url(database_url)
+    if _is_memory_sqlite(url):
+        return {}
+    options = {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 5)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+        'pool_timeout': float(os.environ.get('DB_POOL_TIMEOUT', 30)),
+        'pool_pre_ping': os.environ.get('DB_POOL_PRE_PING', '1') == '1',
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+    }
+    if async_engine and url.get_backend_name() == 'sqlite':
+        # aiosqlite opens a fresh connection per checkout unless asked to pool
+        from sqlalchemy.pool import AsyncAdaptedQueuePool
+        options['poolclass'] = AsyncAdaptedQueuePool
+    return options
+
+
+def sqlite_tuning_enabled(database_url):
+    """Whether the SQLite production profile applies: a file database and SQLITE_TUNING != 0."""
+    url = make_url(database_url)
+    return (url.get_backend_name() == 'sqlite' and not _is_memory_sqlite(url)
+            and os.environ.get('SQLITE_TUNING', '1') != '0')
+
+
+def sqlite_pragmas(read_only=False):
+    """PRAGMA statements run on every new connection by install_sqlite_pragmas().
+
+    WAL lets readers and one writer work at the same time, across processes;
+    synchronous=NORMAL is still crash-safe in WAL mode but skips most fsyncs.
+    Writers wait up to SQLITE_BUSY_TIMEOUT_MS for the write lock instead of
+    failing. SQLITE_CACHE_KB of page cache and SQLITE_MMAP_BYTES of
+    memory-mapped I/O are per connection. Read-only connections also get
+    query_only, so a write through them fails instead of taking the lock.
+    """
+    pragmas = [
+        f"PRAGMA busy_timeout = {int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))}",
+        f"PRAGMA cache_size = -{int(os.environ.get('SQLITE_CACHE_KB', 64 * 1024))}",
+        f"PRAGMA mmap_size = {int(os.environ.get('SQLITE_MMAP_BYTES', 256 * 1024 * 1024))}",
+        "PRAGMA synchronous = NORMAL",
+        "PRAGMA temp_store = MEMORY",
+    ]
+    if read_only:
+        pragmas.append("PRAGMA query_only = 1")
+    else:
+        # Stored in the database file; every later connection uses WAL too
+        pragmas.insert(1, "PRAGMA journal_mode = WAL")
+    return pragmas
+
+
+def install_sqlite_pragmas(engine, read_only=False):
+    """Apply sqlite_pragmas() to each connection engine opens (pass .sync_engine for async engines)."""
+    if not sqlite_tuning_enabled(engine.url):
+        return
+    pragmas = sqlite_pragmas(read_only)
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in pragmas:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
+
+
+def read_database_url(database_url):
+    """URL for the read-only connection pool used by search endpoints, or None for none.
+
+    DATABASE_READ_URL points it somewhere else (a replica); otherwise a
+    tuned SQLite file gets its own pool of query_only connections.
+    """
+    override = os.environ.get('DATABASE_READ_URL')
+    if override:
+        return override
+    return database_url if sqlite_tuning_enabled(database_url) else None
+
+
+def async_database_url(database_url):
+    """The async driver URL for database_url; ASYNC_DATABASE_URL overrides it."""
+    override = os.environ.get('ASYNC_DATABASE_URL')
+    if override:
+        return override
+    url = make_url(database_url)
+    driver = ASYNC_DRIVERS.get(url.drivername) or ASYNC_DRIVERS.get(url.get_backend_name())
+    if driver is None:
+        raise ValueError(f"No async driver configured for {url.drivername}")
+    return url.set(drivername=driver).render_as_string(hide_password=False)
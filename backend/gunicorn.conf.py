@@ -0,0 +1,20 @@
+# Gunicorn settings, read with `gunicorn -c gunicorn.conf.py`.
+#
+# Threaded WSGI (Procfile):  gunicorn app:app -c gunicorn.conf.py
+# Async ASGI (render.yaml):  GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker \
+#                            gunicorn asgi:app -c gunicorn.conf.py
+#
+# Every worker is a separate process with its own DB pool (DB_POOL_SIZE +
+# DB_MAX_OVERFLOW connections), search cache and spatial index, so size
+# WEB_CONCURRENCY by memory as well as cores. With the gthread worker each
+# process serves GUNICORN_THREADS requests at once; keep DB_POOL_SIZE at
+# least that high. Uvicorn workers ignore GUNICORN_THREADS: their async
+# routes share one event loop and Flask-handled routes use ASGI_WSGI_THREADS.
+import os
+
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+# Gunicorn binds to 0.0.0.0:$PORT by default when PORT is set (Render, Heroku)
@@ -0,0 +1,49 @@
+import gzip
+import hashlib
+
+from werkzeug.http import parse_accept_header, parse_etags, quote_etag
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def strong_etag(*parts):
+    """Unquoted ETag hashing parts, which must have a stable repr()."""
+    return hashlib.blake2b(repr(parts).encode(), digest_size=12).hexdigest()
+
+
+def representation_etag(etag, coding=None):
+    # A compressed body is a different representation, so it needs its own strong ETag
+    return etag if coding is None else f'{etag}-{coding}'
+
+
+def accepted_codings(accept_encoding):
+    """Content codings this server can produce that accept_encoding allows, preferred first."""
+    if not accept_encoding:
+        return []
+    accept = parse_accept_header(accept_encoding)
+    return [coding for coding in ('br', 'gzip')
+            if (coding != 'br' or brotli is not None) and accept.quality(coding) > 0]
+
+
+def compress(body, coding):
+    if coding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    # mtime=0 keeps the output identical for identical bodies
+    return gzip.compress(body, GZIP_LEVEL, mtime=0)
+
+
+def held_etag(if_none_match, etags):
+    """The first of etags (unquoted) that an If-None-Match value holds, or None."""
+    held = parse_etags(if_none_match)
+    return next((etag for etag in etags if held.contains_weak(etag)), None)
+
+
+def validator_headers(etag):
+    # no-cache: browsers may store the body but must revalidate it every time
+    return [('Cache-Control', 'no-cache'), ('ETag', quote_etag(etag))]
@@ -0,0 +1,110 @@
+import cProfile
+import io
+import os
+import pstats
+import time
+from contextvars import ContextVar
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from metrics import COUNT_BUCKETS, MetricsRegistry
+
+registry = MetricsRegistry()
+
+request_seconds = registry.histogram(
+    'http_request_duration_seconds', 'Request latency by route.', ['route', 'method', 'status'])
+request_db_queries = registry.histogram(
+    'http_request_db_queries', 'Database queries issued per request.', ['route'], COUNT_BUCKETS)
+request_db_seconds = registry.histogram(
+    'http_request_db_seconds', 'Time spent in database queries per request.', ['route'])
+db_queries_total = registry.counter('db_queries_total', 'Database queries executed.')
+db_seconds_total = registry.counter('db_query_seconds_total', 'Time spent in database queries.')
+nearby_scanned = registry.counter(
+    'nearby_rows_scanned_total', 'Donors distance-checked by /api/donors/nearby.')
+nearby_returned = registry.counter(
+    'nearby_rows_returned_total', 'Donors returned by /api/donors/nearby.')
+
+PROFILE_HEADER = 'X-Profile'
+PROFILE_LINES = 40
+PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', '0') == '1'
+
+# [queries, seconds] for requests served outside Flask (the ASGI handlers)
+_request_db = ContextVar('request_db', default=None)
+
+
+def route_label():
+    return request.url_rule.rule if request.url_rule else 'unmatched'
+
+
+def track_db():
+    """Count DB queries in the current async context; returns the [queries, seconds] tally."""
+    tally = [0, 0.0]
+    _request_db.set(tally)
+    return tally
+
+
+def record_request(route, method, status, seconds, db_queries, db_seconds):
+    request_seconds.observe(seconds, route, method, str(status))
+    request_db_queries.observe(db_queries, route)
+    request_db_seconds.observe(db_seconds, route)
+
+
+def record_nearby(scanned, returned):
+    nearby_scanned.inc(amount=scanned)
+    nearby_returned.inc(amount=returned)
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._query_started = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context._query_started
+    db_queries_total.inc()
+    db_seconds_total.inc(amount=elapsed)
+    if has_request_context() and 'db_queries' in g:
+        g.db_queries += 1
+        g.db_seconds += elapsed
+    else:
+        tally = _request_db.get()
+        if tally is not None:
+            tally[0] += 1
+            tally[1] += elapsed
+
+
+def install(app):
+    """Time every request and, when PROFILING_ENABLED=1, honour X-Profile: 1."""
+    @app.before_request
+    def start_timer():
+        g.request_started = time.perf_counter()
+        g.db_queries = 0
+        g.db_seconds = 0.0
+        if PROFILING_ENABLED and request.headers.get(PROFILE_HEADER) == '1':
+            g.profiler = cProfile.Profile()
+            g.profiler.enable()
+
+    @app.after_request
+    def finish_request(response):
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            profiler.disable()
+            response = profile_response(app, profiler, response)
+        if 'request_started' in g:
+            record_request(route_label(), request.method, response.status_code,
+                           time.perf_counter() - g.request_started, g.db_queries, g.db_seconds)
+        return response
+
+
+def profile_response(app, profiler, response):
+    # Replaces the body with a cProfile summary, keeping the original status
+    output = io.StringIO()
+    output.write(f'{request.method} {request.full_path} -> {response.status}\n')
+    output.write(f'db queries: {g.db_queries}, db time: {g.db_seconds:.6f}s\n\n')
+    pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(PROFILE_LINES)
+    profiled = app.response_class(output.getvalue(), status=response.status_code, mimetype='text/plain')
+    profiled.headers[PROFILE_HEADER] = '1'
+    return profiled
@@ -1,19 +1,72 @@
 from db_instance import db
-from datetime import datetime
+
+def normalize_district(District):
+    return District.strip().lower() if District else District
+
+class DataVersion(db.Model):
+    """A single row counting the transactions that wrote donors.
+
+    bump_data_version() increments it as the last step of a transaction that
+    wrote users, and the row stays locked until that transaction commits.
+    Versions therefore become visible in commit order, unlike ids or
+    timestamps, which are taken before a possibly slow commit, while
+    concurrent writers only wait on each other for the commit itself.
+    """
+    __tablename__ = 'data_version'
+
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, default=0)
+    # Counts the writes that deleted donors or moved them; in-memory indexes,
+    # which only ever add ids, start over when it changes
+    rewrites = db.Column(db.BigInteger, nullable=False, default=0, server_default='0')
+
+# In a writing transaction, the version bump_data_version() took for it
+transaction_version = db.select(DataVersion.version).where(DataVersion.id == 1).scalar_subquery()
+
+def bump_data_version(session, rewrite=False):
+    """Take the next data version and stamp it on the users this transaction wrote.
+
+    Call it last, just before committing. Written rows are left with a NULL
+    data_version until then; other transactions' NULL rows are uncommitted
+    and so not matched. Pass rewrite=True when the transaction deletes
+    donors or changes their blood group or coordinates, rather than only
+    inserting.
+    """
+    session.flush()
+    values = {'version': DataVersion.version + 1}
+    if rewrite:
+        values['rewrites'] = DataVersion.rewrites + 1
+    session.execute(db.update(DataVersion).where(DataVersion.id == 1).values(values))
+    # Setting updated_at to itself keeps its onupdate from firing again
+    stamp = db.update(User).where(User.data_version.is_(None)).values(
+        data_version=transaction_version, updated_at=User.updated_at
+    )
+    session.execute(stamp, execution_options={'synchronize_session': False})
 
 class User(db.Model):
     __tablename__ = 'users'
-    
+    __table_args__ = (
+        db.Index('ix_users_blood_group_lat_lon', 'blood_group', 'latitude', 'longitude'),
+        db.Index('ix_users_blood_group_district_norm', 'blood_group', 'district_norm'),
+        db.Index('ix_users_lat_lon', 'latitude', 'longitude'),
+        db.Index('ix_users_district_norm', 'district_norm'),
+        db.Index('ix_users_data_version_id', 'data_version', 'id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     email = db.Column(db.String(100), nullable=False, unique=True)
     phone = db.Column(db.String(20), nullable=False)
     blood_group = db.Column(db.String(10), nullable=False)
     District = db.Column(db.String(100), nullable=False)
+    district_norm = db.Column(db.String(100), nullable=True)  # lower-cased District for indexed lookups
     latitude = db.Column(db.Float, nullable=True)
     longitude = db.Column(db.Float, nullable=True)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+    updated_at = db.Column(db.DateTime, default=db.func.current_timestamp(), onupdate=db.func.current_timestamp())
+    # Data version of the transaction that last wrote the row; orders /api/donors/changes.
+    # NULL until bump_data_version() stamps it at the end of that transaction.
+    data_version = db.Column(db.BigInteger, onupdate=db.null())
     
     def __init__(self, name, email, phone, blood_group, District, latitude=None, longitude=None):
         self.name = name
@@ -21,6 +74,7 @@ class User(db.Model):
         self.phone = phone
         self.blood_group = blood_group
         self.District = District
+        self.district_norm = normalize_district(District)
         self.latitude = latitude
         self.longitude = longitude
     
@@ -0,0 +1,89 @@
+import base64
+import json
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+
+def encode_cursor(sort, key):
+    raw = json.dumps([sort, key], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        sort, key = json.loads(raw)
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+    return sort, key
+
+
+class Page:
+    """Requested window of a sorted result set.
+
+    Callers fetch up to `fetch` items past the cursor (one more than the page
+    holds, so they can tell whether a next page exists) and pass them to
+    `slice`.
+    """
+
+    def __init__(self, sort, limit, offset=0, after=None):
+        self.sort = sort
+        self.limit = limit
+        self.offset = offset
+        self.after = after
+
+    @property
+    def cache_key(self):
+        return (self.sort, self.limit, self.offset, self.after)
+
+    @property
+    def fetch(self):
+        return self.offset + self.limit + 1
+
+    def slice(self, items, key):
+        """Return (page_items, next_cursor) from items sorted by key."""
+        items = items[self.offset:]
+        if len(items) <= self.limit:
+            return items, None
+        items = items[:self.limit]
+        return items, encode_cursor(self.sort, key(items[-1]))
+
+
+def parse_page_args(args, sorts):
+    """Build a Page from limit/cursor/offset/sort query args.
+
+    sorts maps each allowed sort name to the number of parts in its cursor
+    key; the first one is the default. Returns None when none of the args are
+    present, so endpoints keep their unpaginated response. Raises ValueError
+    for invalid values.
+    """
+    if not any(name in args for name in ('limit', 'cursor', 'offset', 'sort')):
+        return None
+
+    sort = args.get('sort', next(iter(sorts)))
+    if sort not in sorts:
+        raise ValueError(f"sort must be one of: {', '.join(sorts)}")
+
+    try:
+        limit = int(args.get('limit', DEFAULT_LIMIT))
+        offset = int(args.get('offset', 0))
+    except ValueError:
+        raise ValueError('limit and offset must be integers')
+    if not 1 <= limit <= MAX_LIMIT:
+        raise ValueError(f"limit must be between 1 and {MAX_LIMIT}")
+    if offset < 0:
+        raise ValueError('offset must not be negative')
+
+    after = None
+    if args.get('cursor'):
+        cursor_sort, after = decode_cursor(args['cursor'])
+        if cursor_sort != sort:
+            raise ValueError('Cursor does not match the requested sort')
+        parts = after if isinstance(after, list) else [after]
+        if len(parts) != sorts[sort] or not all(isinstance(part, (int, float)) for part in parts):
+            raise ValueError('Invalid cursor')
+        if isinstance(after, list):
+            after = tuple(after)
+        offset = 0
+    return Page(sort, limit, offset, after)
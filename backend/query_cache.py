@@ -0,0 +1,84 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class QueryCache:
+    """LRU cache of encoded search responses with a TTL and a byte budget.
+
+    Entries are tagged with the data version current when their query
+    started; bump_version() (called whenever donors are written) makes every
+    older entry a miss. The TTL bounds staleness for writes made by other
+    worker processes, which cannot bump this process's version.
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024, ttl=30):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.version = 0
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def bump_version(self):
+        with self._lock:
+            self.version += 1
+
+    def _drop(self, key):
+        _, _, body = self._entries.pop(key)
+        self.bytes -= len(body)
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            version, expires, body = entry
+            if version != self.version or expires < time.monotonic():
+                self._drop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def set(self, key, body, version):
+        """Store body for key if version is still current."""
+        if not self.enabled or len(body) > self.max_bytes:
+            return
+        with self._lock:
+            if version != self.version:
+                return
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (version, time.monotonic() + self.ttl, body)
+            self.bytes += len(body)
+            while self.bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        return {
+            'entries': len(self._entries),
+            'bytes': self.bytes,
+            'max_bytes': self.max_bytes,
+            'version': self.version,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
@@ -1,4 +1,5 @@
-from app_fixed import app, db, User
+from app import app, db, User, init_db
+from models import bump_data_version
 
 def seed_database():
     """Populate database with sample data with Indian districts"""
@@ -145,14 +146,18 @@ def seed_database():
     
     # Add users to database
     with app.app_context():
-        # Clear existing data
+        init_db()
+
+        # Clear existing data; ids are reused, so workers must re-index
         db.session.query(User).delete()
+        bump_data_version(db.session, rewrite=True)
         db.session.commit()
         
         # Add new users
         for user in users:
             db.session.add(user)
         
+        bump_data_version(db.session)
         db.session.commit()
         print(f"Added {len(users)} sample users with Indian districts to the database")
 
@@ -0,0 +1,149 @@
+import heapq
+import math
+import threading
+from itertools import chain, islice
+
+from catch_up import CatchUp
+from distance_engine import EARTH_RADIUS_KM, DonorCoordinates, np, valid_coordinates
+
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+def bounding_box(latitude, longitude, radius):
+    """Return (min_lat, max_lat, lon_ranges) covering a radius in km.
+
+    lon_ranges is a list of (min_lon, max_lon) pairs; it holds two pairs when
+    the box crosses the antimeridian.
+    """
+    dlat = radius / KM_PER_DEGREE
+    min_lat = max(latitude - dlat, -90.0)
+    max_lat = min(latitude + dlat, 90.0)
+
+    widest = max(abs(min_lat), abs(max_lat))
+    if widest >= 90.0:
+        return min_lat, max_lat, [(-180.0, 180.0)]
+    dlon = radius / (KM_PER_DEGREE * math.cos(math.radians(widest)))
+    if dlon >= 180.0:
+        return min_lat, max_lat, [(-180.0, 180.0)]
+
+    min_lon = longitude - dlon
+    max_lon = longitude + dlon
+    if min_lon < -180.0:
+        return min_lat, max_lat, [(min_lon + 360.0, 180.0), (-180.0, max_lon)]
+    if max_lon > 180.0:
+        return min_lat, max_lat, [(min_lon, 180.0), (-180.0, max_lon - 360.0)]
+    return min_lat, max_lat, [(min_lon, max_lon)]
+
+
+class DonorSpatialIndex:
+    """Uniform lat/lon grid of donor coordinates, partitioned by blood group.
+
+    Coordinates live in a columnar DonorCoordinates store and each cell holds
+    positions into it, so a lookup only measures donors in the cells
+    overlapping the query's bounding box. The index tracks which ids it has
+    seen (catch_up), which lets callers catch up on rows inserted by other
+    workers with a cheap primary-key range query.
+
+    base is an optional read-only index (a DonorSnapshot) holding every donor
+    up to base.max_id; this index then only stores newer rows and search()
+    merges the two. rewrites is the DataVersion.rewrites count the rows were
+    read at, None until the first sync sets it.
+    """
+
+    def __init__(self, cell_size=0.1, base=None, rewrites=None):
+        self.cell_size = cell_size
+        self.base = base
+        self.rewrites = rewrites
+        self.catch_up = CatchUp(base.max_id if base is not None else 0)
+        self.loaded = False
+        self.coords = DonorCoordinates()
+        self._groups = {}
+        self._lock = threading.Lock()
+
+    @property
+    def max_id(self):
+        return self.catch_up.max_id
+
+    @property
+    def size(self):
+        return self.coords.size + (self.base.size if self.base is not None else 0)
+
+    def _cell(self, latitude, longitude):
+        return (math.floor(latitude / self.cell_size),
+                math.floor(longitude / self.cell_size))
+
+    def add(self, donor_id, blood_group, latitude, longitude):
+        with self._lock:
+            if self.catch_up.see(donor_id) and valid_coordinates(latitude, longitude):
+                self._insert(donor_id, blood_group, latitude, longitude)
+
+    def _insert(self, donor_id, blood_group, latitude, longitude):
+        position = self.coords.append(donor_id, blood_group, latitude, longitude)
+        cells = self._groups.setdefault(blood_group, {})
+        cells.setdefault(self._cell(latitude, longitude), []).append(position)
+
+    def load(self, rows):
+        """Add (id, blood_group, latitude, longitude) rows in one locked pass."""
+        with self._lock:
+            for donor_id, blood_group, latitude, longitude in rows:
+                # Concurrent syncs may fetch the same rows twice; rows stored
+                # before coordinates were validated must not break the grid
+                if self.catch_up.see(donor_id) and valid_coordinates(latitude, longitude):
+                    self._insert(donor_id, blood_group, latitude, longitude)
+            self.loaded = True
+
+    def search(self, latitude, longitude, radius, blood_group=None, limit=None, after=None, stats=None):
+        """Return (id, distance) pairs within radius km, nearest first.
+
+        limit keeps only the nearest matches; after is a (distance, id) cursor.
+        If a stats dict is given, stats['scanned'] is set to the number of
+        donors whose distance was computed.
+        """
+        matches = self._search(latitude, longitude, radius, blood_group, limit, after, stats)
+        if self.base is None:
+            return matches
+        base_stats = {}
+        base_matches = self.base.search(latitude, longitude, radius, blood_group, limit, after, base_stats)
+        if stats is not None:
+            stats['scanned'] += base_stats['scanned']
+        merged = heapq.merge(base_matches, matches, key=lambda match: (match[1], match[0]))
+        return list(islice(merged, limit))
+
+    def _search(self, latitude, longitude, radius, blood_group=None, limit=None, after=None, stats=None):
+        if blood_group:
+            partitions = [self._groups.get(blood_group)]
+        else:
+            partitions = list(self._groups.values())
+        partitions = [cells for cells in partitions if cells]
+        if not partitions:
+            if stats is not None:
+                stats['scanned'] = 0
+            return []
+
+        min_lat, max_lat, lon_ranges = bounding_box(latitude, longitude, radius)
+        row_lo = math.floor(min_lat / self.cell_size)
+        row_hi = math.floor(max_lat / self.cell_size)
+        col_ranges = [(math.floor(min_lon / self.cell_size), math.floor(max_lon / self.cell_size))
+                      for min_lon, max_lon in lon_ranges]
+        span = (row_hi - row_lo + 1) * sum(hi - lo + 1 for lo, hi in col_ranges)
+        populated = sum(len(cells) for cells in partitions)
+
+        # Wide searches cover more cells than are populated
+        if span > populated:
+            if np is not None:
+                return self.coords.scan(latitude, longitude, radius, blood_group, min_lat, max_lat,
+                                        limit, after, stats)
+            hits = (entries for cells in partitions for (row, col), entries in list(cells.items())
+                    if row_lo <= row <= row_hi
+                    and any(lo <= col <= hi for lo, hi in col_ranges))
+        else:
+            hits = (cells[(row, col)]
+                    for cells in partitions
+                    for row in range(row_lo, row_hi + 1)
+                    for lo, hi in col_ranges
+                    for col in range(lo, hi + 1)
+                    if (row, col) in cells)
+        positions = list(chain.from_iterable(hits))
+        if stats is not None:
+            stats['scanned'] = len(positions)
+        return self.coords.within(latitude, longitude, radius, positions, limit, after)
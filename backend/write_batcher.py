@@ -0,0 +1,79 @@
+import threading
+
+
+class _Batch:
+    def __init__(self):
+        self.items = []
+        self.full = threading.Event()
+        self.done = threading.Event()
+        self.results = None
+        self.errors = None
+
+
+class WriteBatcher:
+    """Groups writes from concurrent threads into one flush.
+
+    The first caller to submit() starts a batch and waits up to max_wait
+    seconds for others to join (or until max_size have), then runs
+    flush(items) on its own thread for everyone. Only one flush runs at a
+    time and a batch keeps accepting items while it waits for the previous
+    one, so under load batches grow to match how long a flush takes. flush
+    returns one result per item, in order. If it raises, the items are
+    flushed again one at a time, so only the callers whose item fails get
+    an exception.
+    """
+
+    def __init__(self, flush, max_wait=0.002, max_size=100):
+        self.flush = flush
+        self.max_wait = max_wait
+        self.max_size = max_size
+        self.batches = 0
+        self.items = 0
+        self._batch = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def submit(self, item):
+        with self._lock:
+            batch = self._batch
+            leader = batch is None
+            if leader:
+                batch = self._batch = _Batch()
+            position = len(batch.items)
+            batch.items.append(item)
+            if len(batch.items) >= self.max_size:
+                self._batch = None
+                batch.full.set()
+
+        if leader:
+            batch.full.wait(self.max_wait)
+            with self._flush_lock:
+                with self._lock:
+                    if self._batch is batch:
+                        self._batch = None
+                    self.batches += 1
+                    self.items += len(batch.items)
+                try:
+                    batch.results = self.flush(batch.items)
+                except Exception as e:
+                    if len(batch.items) == 1:
+                        batch.errors = [e]
+                    else:
+                        batch.results, batch.errors = self._flush_each(batch.items)
+                finally:
+                    batch.done.set()
+        else:
+            batch.done.wait()
+
+        if batch.errors is not None and batch.errors[position] is not None:
+            raise batch.errors[position]
+        return batch.results[position]
+
+    def _flush_each(self, items):
+        results, errors = [None] * len(items), [None] * len(items)
+        for i, item in enumerate(items):
+            try:
+                results[i] = self.flush([item])[0]
+            except Exception as e:
+                errors[i] = e
+        return results, errors
@@ -1,7 +1,6 @@
 import React, { useState, useEffect } from 'react';
 import { Form, Button, Container, Row, Col, Card, Badge, Alert, Tabs, Tab, ListGroup, Pagination } from 'react-bootstrap';
 import axios from 'axios';
-import { indianDistricts } from '../data/indianDistricts';
 
 function Search() {
   const [searchType, setSearchType] = useState('basic');
@@ -20,25 +19,44 @@ function Search() {
   const [districtSuggestions, setDistrictSuggestions] = useState([]);
   const [showSuggestions, setShowSuggestions] = useState(false);
   const [currentPage, setCurrentPage] = useState(1);
+  // The last API search, paged by the server; null while sample donors are shown
+  const [query, setQuery] = useState(null);
+  // Cursor for each page reached so far (page 1 needs none)
+  const [pageCursors, setPageCursors] = useState([null]);
   const donorsPerPage = 4; // Show only 4 donors per page
 
   const bloodGroups = ['A+', 'A-', 'B+', 'B-', 'AB+', 'AB-', 'O+', 'O-'];
 
   // Handle district input change
   useEffect(() => {
-    const searchDistrict = formData.District.trim().toLowerCase();
+    const searchDistrict = formData.District.trim();
     if (searchDistrict.length < 2) {
       setDistrictSuggestions([]);
       return;
     }
-    
-    // Filter districts based on user input
-    const filteredDistricts = indianDistricts.filter(district => 
-      district.toLowerCase().includes(searchDistrict)
-    ).slice(0, 10); // Limit to 10 suggestions for better UI
-    
-    setDistrictSuggestions(filteredDistricts);
-    setShowSuggestions(filteredDistricts.length > 0);
+
+    // Ask the backend's district index; ignore responses for outdated input
+    let cancelled = false;
+    const timer = setTimeout(async () => {
+      try {
+        const response = await axios.get(`${process.env.REACT_APP_API_URL}/districts/suggest`, {
+          params: { q: searchDistrict, limit: 10 } // Limit to 10 suggestions for better UI
+        });
+        if (!cancelled) {
+          setDistrictSuggestions(response.data);
+          setShowSuggestions(response.data.length > 0);
+        }
+      } catch (err) {
+        if (!cancelled) {
+          setDistrictSuggestions([]);
+        }
+      }
+    }, 150);
+
+    return () => {
+      cancelled = true;
+      clearTimeout(timer);
+    };
   }, [formData.District]);
 
   const handleChange = (e) => {
@@ -121,6 +139,22 @@ function Search() {
       geoOptions
     );
   };
+  // Fetch one page of a search: only that page's donors are downloaded
+  const loadPage = async (search, page, cursors) => {
+    const params = { ...search.params, limit: donorsPerPage };
+    if (cursors[page - 1]) {
+      params.cursor = cursors[page - 1];
+    }
+    const response = await axios.get(search.url, { params });
+    const { donors: results, next_cursor: nextCursor } = response.data;
+    const known = cursors.slice(0, page);
+    setPageCursors(nextCursor ? [...known, nextCursor] : known);
+    setQuery(search);
+    setCurrentPage(page);
+    setDonors(results);
+    return results;
+  };
+
   const handleBasicSearch = async (e) => {
     e.preventDefault();
     setLoading(true);
@@ -134,26 +168,18 @@ function Search() {
     }
 
     try {
-      const apiUrl = `${process.env.REACT_APP_API_URL}/donors`;
-      const response = await axios.get(apiUrl, {
+      const search = {
+        url: `${process.env.REACT_APP_API_URL}/donors`,
         params: {
           bloodGroup: formData.bloodGroup,
           District: formData.District
         }
-      });
-      
-      let results = response.data;
-      
-      // Additional client-side filtering to ensure exact district match
-      results = results.filter(donor => 
-        donor.District && donor.District.toLowerCase() === formData.District.toLowerCase()
-      );
+      };
+      const results = await loadPage(search, 1, [null]);
 
       // Add sample donors if no results or for testing
       if (results.length === 0) {
         addSampleDonors();
-      } else {
-        setDonors(results);
       }
       
       setSearched(true);
@@ -179,35 +205,20 @@ function Search() {
     }
 
     try {
-      const apiUrl = `${process.env.REACT_APP_API_URL}/donors/nearby`;
-      const params = {
-        bloodGroup: formData.bloodGroup,
-        latitude: formData.latitude,
-        longitude: formData.longitude,
-        radius: formData.radius
+      const search = {
+        url: `${process.env.REACT_APP_API_URL}/donors/nearby`,
+        params: {
+          bloodGroup: formData.bloodGroup,
+          latitude: formData.latitude,
+          longitude: formData.longitude,
+          radius: formData.radius
+        }
       };
-      
-      // Add district parameter if provided
-      if (formData.District.trim()) {
-        params.District = formData.District;
-      }
-      
-      const response = await axios.get(apiUrl, { params });
-      
-      let results = response.data;
-      
-      // Additional client-side filtering if district is specified
-      if (formData.District.trim()) {
-        results = results.filter(donor => 
-          donor.District && donor.District.toLowerCase() === formData.District.toLowerCase()
-        );
-      }
-      
+      const results = await loadPage(search, 1, [null]);
+
       // Add sample donors if no results or for testing
       if (results.length === 0) {
         addSampleDonors();
-      } else {
-        setDonors(results);
       }
       
       setSearched(true);
@@ -224,27 +235,39 @@ function Search() {
   const handleTabChange = (key) => {
     setSearchType(key);
     setDonors([]);
+    setQuery(null);
     setSearched(false);
     setError('');
   };
 
-  // Pagination logic
+  // Pagination logic: API results hold one page, sample donors are paged here
   const indexOfLastDonor = currentPage * donorsPerPage;
   const indexOfFirstDonor = indexOfLastDonor - donorsPerPage;
-  const currentDonors = donors.slice(indexOfFirstDonor, indexOfLastDonor);
-  
+  const currentDonors = query ? donors : donors.slice(indexOfFirstDonor, indexOfLastDonor);
+  const pageCount = query ? pageCursors.length : Math.ceil(donors.length / donorsPerPage);
+  const hasMore = currentPage < pageCount;
+
   // Change page
-  const paginate = (pageNumber) => setCurrentPage(pageNumber);
-  
-  // Reset to first page when new search is done
-  useEffect(() => {
-    if (searched) {
-      setCurrentPage(1);
+  const paginate = async (pageNumber) => {
+    if (!query) {
+      setCurrentPage(pageNumber);
+      return;
     }
-  }, [donors, searched]);
+    setLoading(true);
+    setError('');
+    try {
+      await loadPage(query, pageNumber, pageCursors);
+    } catch (err) {
+      setError(err.response?.data?.error || err.message);
+    } finally {
+      setLoading(false);
+    }
+  };
 
   // Add sample donors for testing if none are found
   const addSampleDonors = () => {
+    setQuery(null);
+    setCurrentPage(1);
     const sampleDonors = [
       {
         id: 1001,
@@ -563,9 +586,12 @@ function Search() {
           {donors.length > 0 && (
             <>
               <div className="d-flex justify-content-between align-items-center mb-3">
-                <h3 className="mb-0">Found {donors.length} {donors.length === 1 ? 'donor' : 'donors'}</h3>
+                <h3 className="mb-0">
+                  {query ? 'Donors found' : `Found ${donors.length} ${donors.length === 1 ? 'donor' : 'donors'}`}
+                </h3>
                 <div className="text-muted small">
-                  Showing {indexOfFirstDonor + 1} - {Math.min(indexOfLastDonor, donors.length)} of {donors.length}
+                  Showing {indexOfFirstDonor + 1} - {indexOfFirstDonor + currentDonors.length}
+                  {query ? (hasMore ? '' : ` of ${indexOfFirstDonor + currentDonors.length}`) : ` of ${donors.length}`}
                 </div>
               </div>
               <Row>
@@ -593,17 +619,18 @@ function Search() {
               {/* Pagination controls */}
               <div className="d-flex justify-content-center mt-4">
                 <Pagination>
-                  <Pagination.Prev onClick={() => paginate(currentPage - 1)} disabled={currentPage === 1} />
-                  {[...Array(Math.ceil(donors.length / donorsPerPage)).keys()].map(page => (
+                  <Pagination.Prev onClick={() => paginate(currentPage - 1)} disabled={loading || currentPage === 1} />
+                  {[...Array(pageCount).keys()].map(page => (
                     <Pagination.Item 
                       key={page + 1} 
                       active={page + 1 === currentPage} 
                       onClick={() => paginate(page + 1)}
+                      disabled={loading}
                     >
                       {page + 1}
                     </Pagination.Item>
                   ))}
-                  <Pagination.Next onClick={() => paginate(currentPage + 1)} disabled={currentPage === Math.ceil(donors.length / donorsPerPage)} />
+                  <Pagination.Next onClick={() => paginate(currentPage + 1)} disabled={loading || !hasMore} />
                 </Pagination>
               </div>
             </>